@@ -0,0 +1,300 @@
+"""End to end benchmarks of the hot endpoints
+
+Requests go straight into the ASGI app through httpx, so the numbers
+measure the app and its database, not a network or a server process.
+Point it at a seeded database (see `microblog seed`):
+
+    export MICROBLOG_DB__uri=sqlite:///bench.db     # or a local postgres
+    microblog seed --users 2000 --posts 50000
+    python benchmarks/bench.py run -o baseline.json
+    # ... change things ...
+    python benchmarks/bench.py run -o current.json
+    python benchmarks/bench.py compare baseline.json current.json
+
+`compare` exits with 1 when an endpoint got slower (p95), lost
+throughput or runs more queries per request than the tolerance allows.
+
+Settings that would skew the numbers are overridden in `env.py`.
+"""
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import env  # noqa: F401  sets the settings, before any microblog import
+
+import httpx
+import typer
+from rich.console import Console
+from rich.table import Table
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from microblog.app import app
+from microblog.db import async_engine, engine
+from microblog.models import Post, User
+
+cli = typer.Typer(name="Microblog benchmarks")
+
+# statuses that count as a successful call for each endpoint
+EXPECTED = {
+    "token": {200},
+    "posts": {200},
+    "timeline": {200},
+    # the seeded data may already hold the like, 400 is the fast path
+    "like": {201, 400},
+}
+
+
+class QueryCounter:
+    """Counts statements sent through the async engine"""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(async_engine.sync_engine, "before_cursor_execute", self)
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def percentile(samples: List[float], pct: int) -> float:
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+
+def load_fixtures(prefix: str, accounts: int):
+    """Seeded usernames and post ids to spread the requests over"""
+    with Session(engine) as session:
+        usernames = session.exec(
+            select(User.username)
+            .where(User.username.like(f"{prefix}%"))
+            .order_by(User.id)
+            .limit(accounts)
+        ).all()
+        post_ids = session.exec(select(Post.id)).all()
+    if not usernames or not post_ids:
+        raise typer.BadParameter(
+            f"No {prefix}* users or posts, run `microblog seed` first"
+        )
+    return usernames, post_ids
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str):
+    response = await client.post(
+        "/token", data={"username": username, "password": password}
+    )
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def scenarios(usernames, post_ids, headers, password, rng):
+    """Builds one request per call, keyed by endpoint name"""
+
+    def token(client):
+        return client.post(
+            "/token",
+            data={"username": rng.choice(usernames), "password": password},
+        )
+
+    def posts(client):
+        return client.get("/post/")
+
+    def timeline(client):
+        return client.get("/user/timeline", headers=rng.choice(headers))
+
+    def like(client):
+        return client.post(
+            f"/post/{rng.choice(post_ids)}/like/",
+            headers=rng.choice(headers),
+        )
+
+    return {
+        "token": token,
+        "posts": posts,
+        "timeline": timeline,
+        "like": like,
+    }
+
+
+async def measure(
+    client: httpx.AsyncClient,
+    name: str,
+    make_request: Callable,
+    requests: int,
+    concurrency: int,
+    counter: QueryCounter,
+) -> dict:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await make_request(client)
+            latencies.append(time.perf_counter() - started)
+            code = str(response.status_code)
+            statuses[code] = statuses.get(code, 0) + 1
+
+    queries = counter.count
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    queries = counter.count - queries
+
+    errors = sum(
+        count for code, count in statuses.items()
+        if int(code) not in EXPECTED[name]
+    )
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "statuses": statuses,
+        "rps": requests / elapsed,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "queries_per_request": queries / requests,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: dict):
+    table = Table(title="Microblog benchmarks")
+    columns = ["rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request"]
+    table.add_column("endpoint", style="magenta")
+    for column in columns + ["errors"]:
+        table.add_column(column, justify="right")
+    for name, result in results.items():
+        table.add_row(
+            name,
+            *(f"{result[column]:.2f}" for column in columns),
+            str(result["errors"]),
+        )
+    Console().print(table)
+
+
+@cli.command()
+def run(
+    requests: int = typer.Option(500, "-n", help="Requests per endpoint"),
+    concurrency: int = typer.Option(10, "-c", help="Concurrent clients"),
+    warmup: int = typer.Option(20, help="Untimed requests per endpoint"),
+    only: List[str] = typer.Option(
+        list(EXPECTED), "--endpoint", "-e", help="Endpoints to run"
+    ),
+    prefix: str = typer.Option("seed", help="Seeded username prefix"),
+    password: str = typer.Option("microblog", help="Seeded password"),
+    accounts: int = typer.Option(50, help="Users to log in as"),
+    seed: int = typer.Option(42, help="Random generator seed"),
+    output: Optional[str] = typer.Option(None, "-o", help="JSON results"),
+):
+    """Benchmarks the hot endpoints against the configured database"""
+    rng = random.Random(seed)
+    usernames, post_ids = load_fixtures(prefix, accounts)
+
+    async def main():
+        counter = QueryCounter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            headers = [
+                await login(client, username, password)
+                for username in usernames
+            ]
+            calls = scenarios(usernames, post_ids, headers, password, rng)
+            results = {}
+            for name in only:
+                if warmup:
+                    await measure(
+                        client, name, calls[name], warmup, concurrency,
+                        counter,
+                    )
+                results[name] = await measure(
+                    client, name, calls[name], requests, concurrency, counter
+                )
+        await async_engine.dispose()
+        return results
+
+    results = asyncio.run(main())
+    print_results(results)
+    if output:
+        report = {
+            "meta": {
+                "date": datetime.now(timezone.utc).isoformat(),
+                "revision": git_revision(),
+                "database": engine.dialect.name,
+                "python": platform.python_version(),
+                "requests": requests,
+                "concurrency": concurrency,
+            },
+            "results": results,
+        }
+        with open(output, "w") as fp:
+            json.dump(report, fp, indent=2)
+        typer.echo(f"results saved to {output}")
+
+
+def regressions(baseline: dict, current: dict, tolerance: float) -> List[str]:
+    """Describes every metric that got worse by more than `tolerance`"""
+    found = []
+    for name, new in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        if new["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            found.append(
+                f"{name}: p95 {old['p95_ms']:.2f}ms -> {new['p95_ms']:.2f}ms"
+            )
+        if new["rps"] < old["rps"] * (1 - tolerance):
+            found.append(f"{name}: rps {old['rps']:.1f} -> {new['rps']:.1f}")
+        if new["queries_per_request"] > old["queries_per_request"] + 0.01:
+            found.append(
+                f"{name}: queries/request {old['queries_per_request']:.2f}"
+                f" -> {new['queries_per_request']:.2f}"
+            )
+        if new["errors"] > old["errors"]:
+            found.append(f"{name}: errors {old['errors']} -> {new['errors']}")
+    return found
+
+
+@cli.command()
+def compare(
+    baseline: str,
+    current: str,
+    tolerance: float = typer.Option(
+        0.1, help="Allowed relative slowdown before flagging"
+    ),
+):
+    """Flags regressions between two saved runs"""
+    with open(baseline) as fp:
+        old = json.load(fp)
+    with open(current) as fp:
+        new = json.load(fp)
+    found = regressions(old, new, tolerance)
+    for line in found:
+        typer.secho(f"REGRESSION {line}", fg=typer.colors.RED)
+    if found:
+        raise typer.Exit(1)
+    typer.echo("no regressions")
+
+
+if __name__ == "__main__":
+    cli()
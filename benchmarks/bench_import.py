@@ -0,0 +1,106 @@
+"""Cold start cost of the app and the CLI
+
+Each module is imported in a fresh interpreter, so nothing is cached
+but the bytecode; the median of the runs is compared to its budget.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --module microblog.cli --top 20
+
+`--top` lists the slowest imports of each module as reported by
+`python -X importtime`. Exits with 1 when a module is over budget.
+"""
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+import env  # noqa: F401  sets the settings, before any microblog import
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+# milliseconds, median of a cold import on a laptop
+BUDGETS = {
+    "microblog.cli": 400,
+    "microblog.models": 1200,
+    "microblog.app": 2500,
+}
+
+cli = typer.Typer(name="Microblog import benchmark")
+
+
+def import_time(module: str) -> float:
+    """Seconds to import `module` in a new interpreter"""
+    code = (
+        "import time; started = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - started)"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code])
+    return float(output)
+
+
+def slowest_imports(module: str, top: int) -> List[Tuple[int, str]]:
+    """(cumulative microseconds, name) of the slowest imports"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            timings[name.strip()] = int(cumulative)
+    ranked = sorted(
+        ((micros, name) for name, micros in timings.items()), reverse=True
+    )
+    return ranked[:top]
+
+
+@cli.command()
+def run(
+    module: List[str] = typer.Option(
+        list(BUDGETS), help="Modules to import"
+    ),
+    repeat: int = typer.Option(7, help="Imports per module"),
+    top: int = typer.Option(0, help="List the N slowest imports"),
+):
+    """Times each import and checks it against its budget"""
+    table = Table(title="Import time")
+    for column in ["module", "median ms", "min ms", "budget ms"]:
+        table.add_column(column, justify="right")
+
+    over = []
+    for name in module:
+        runs = [import_time(name) * 1000 for _ in range(repeat)]
+        median = statistics.median(runs)
+        budget = BUDGETS.get(name)
+        if budget is not None and median > budget:
+            over.append(name)
+        table.add_row(
+            name,
+            f"{median:.0f}",
+            f"{min(runs):.0f}",
+            "-" if budget is None else str(budget),
+        )
+    Console().print(table)
+
+    for name in module if top else []:
+        offenders = Table(title=f"Slowest imports of {name}")
+        for column in ["module", "cumulative ms"]:
+            offenders.add_column(column, justify="right")
+        for micros, imported in slowest_imports(name, top):
+            offenders.add_row(imported, f"{micros / 1000:.1f}")
+        Console().print(offenders)
+
+    if over:
+        typer.echo(f"over budget: {', '.join(over)}", err=True)
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,117 @@
+"""Serialization cost of a page of posts, default path vs fast JSON
+
+No database involved, this times only what happens after the query:
+
+- default: ORM `Post` objects validated against `Page[PostResponse]` by
+  FastAPI and encoded by `JSONResponse`;
+- fast: column row tuples encoded by `microblog.responses.page_response`.
+
+    python benchmarks/bench_json.py --rows 100 --rows 1000
+"""
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import env  # noqa: F401  sets the settings, before any microblog import
+
+import typer
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from rich.console import Console
+from rich.table import Table
+
+from microblog import responses
+from microblog.models.post import Post, PostResponse
+from microblog.pagination import Page
+
+cli = typer.Typer(name="Microblog JSON benchmark")
+
+
+def make_posts(count: int) -> List[Post]:
+    start = datetime(2024, 1, 1)
+    return [
+        Post(
+            id=n,
+            text=f"post number {n} " * 8,
+            date=start + timedelta(seconds=n, microseconds=n),
+            user_id=n % 50,
+            parent_id=None if n % 3 else n - 1,
+            like_count=n % 17,
+            reply_count=n % 5,
+        )
+        for n in range(1, count + 1)
+    ]
+
+
+def as_rows(posts: List[Post]) -> List[tuple]:
+    """What `select(*projection(Post, POST_FIELDS))` returns for them"""
+    return [
+        tuple(getattr(post, name) for name in responses.POST_FIELDS)
+        for post in posts
+    ]
+
+
+async def default_path(field, posts: List[Post]) -> bytes:
+    content = await serialize_response(
+        field=field, response_content=Page(items=posts)
+    )
+    return JSONResponse(content).body
+
+
+def fast_path(rows: List[tuple]) -> bytes:
+    return responses.page_response(Page(items=rows)).body
+
+
+def timed(call, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - started) / repeat
+
+
+@cli.command()
+def run(
+    rows: List[int] = typer.Option([20, 100, 1000], help="Posts per page"),
+    repeat: int = typer.Option(200, help="Pages encoded per measurement"),
+):
+    """Times both paths and checks they produce the same JSON"""
+    responses.FAST_JSON = True
+    field = create_model_field(
+        "Response", Page[PostResponse], mode="serialization"
+    )
+    loop = asyncio.new_event_loop()
+    table = Table(title="Page serialization")
+    for column in ["rows", "default ms", "fast ms", "speedup"]:
+        table.add_column(column, justify="right")
+
+    for count in rows:
+        posts = make_posts(count)
+        page_rows = as_rows(posts)
+        default_body = loop.run_until_complete(default_path(field, posts))
+        assert json.loads(default_body) == json.loads(fast_path(page_rows)), (
+            "fast path output differs"
+        )
+
+        default = timed(
+            lambda: loop.run_until_complete(default_path(field, posts)),
+            repeat,
+        )
+        fast = timed(lambda: fast_path(page_rows), repeat)
+        table.add_row(
+            str(count),
+            f"{default * 1000:.3f}",
+            f"{fast * 1000:.3f}",
+            f"{default / fast:.1f}x",
+        )
+    loop.close()
+    Console().print(table)
+    typer.echo(
+        f"encoder: {'orjson' if responses.orjson else 'pydantic_core'}"
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,18 @@
+"""Settings shared by the benchmarks
+
+Benchmark scripts import this module before anything from microblog,
+which reads its settings on import:
+
+- no SQL echo, printing each statement would dominate the timings;
+- no response cache, the "posts" scenario would otherwise measure cache
+  hits after its first request instead of the query and the encoding;
+- no rate limiting, every request comes from the same client and the
+  "token" and "like" scenarios would otherwise measure 429 responses.
+
+Variables already set in the environment win.
+"""
+import os
+
+os.environ.setdefault("MICROBLOG_DB__echo", "false")
+os.environ.setdefault("MICROBLOG_CACHE__ENABLED", "false")
+os.environ.setdefault("MICROBLOG_RATELIMIT__ENABLED", "false")
@@ -1,11 +1,37 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
+from sqlalchemy.orm import configure_mappers
+
+from microblog import live
+from microblog.instrumentation import QueryStatsMiddleware
+from microblog.metrics import MetricsMiddleware, monitor_loop_lag
 from microblog.routes import main_router
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # mappers are configured on first use, do it before the first request
+    configure_mappers()
+    lag_monitor = asyncio.create_task(monitor_loop_lag())
+    await live.broker.start()
+    yield
+    await live.broker.stop()
+    lag_monitor.cancel()
+    with suppress(asyncio.CancelledError):
+        await lag_monitor
+
+
 app = FastAPI(
     title="Microblog",
     version="0.0.1",
     description="A simple microblog app",
+    lifespan=lifespan,
 )
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 
 @app.get('/')
 async def index():
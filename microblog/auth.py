@@ -1,21 +1,49 @@
 """Token absed auth"""
+import hashlib
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Callable, Optional, Union
+from functools import lru_cache
+from typing import Callable, List, Optional, Union
 
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from sqlalchemy import event, inspect
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.sql import Select
 
-from microblog.config import settings
-from microblog.db import engine
+from microblog.cache import TTLCache
+from microblog.config import config
+from microblog.dependencies import AsyncActiveSession
 from microblog.models.user import User
-from microblog.security import verify_password
+from microblog.security import verify_password_async
+from microblog.tokens import TokenError, get_backend
 
-SECRET_KEY = settings.security.secret_key
-ALGORITHM = settings.security.algorithm
+SECRET_KEY = config.security.secret_key
+ALGORITHM = config.security.algorithm
+
+
+@lru_cache(maxsize=None)
+def jwt_backend():
+    """The configured JWT backend, its library is imported on first use"""
+    return get_backend(config.security.jwt_backend, SECRET_KEY, ALGORITHM)
+
+
+# sha256 of the token -> verified payload, kept until the token expires
+token_cache = TTLCache(
+    maxsize=config.security.token_cache_size,
+    ttl=config.security.token_cache_ttl,
+)
+
+# callables taking a verified payload, returning True if it was revoked
+revocation_hooks: List[Callable[[dict], bool]] = []
+
+# username -> column values of the user, see `load_user`
+user_cache = TTLCache(
+    maxsize=config.security.user_cache_size,
+    ttl=config.security.user_cache_ttl,
+)
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -45,7 +73,7 @@ def create_access_token(
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire, "scope": "access_token"})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt_backend().encode(to_encode)
     return encoded_jwt
 
 
@@ -59,31 +87,80 @@ def create_refresh_token(
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire, "scope": "refresh_token"})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt_backend().encode(to_encode)
     return encoded_jwt
 
 
-def authenticate_user(
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+def decode_token(token: str) -> dict:
+    """Verifies a token, memoizing the payload until it expires
+
+    Revocation hooks run on every call, cached or not.
+    """
+    digest = _token_digest(token)
+    payload = token_cache.get(digest)
+    if payload is None or payload["exp"] <= time.time():
+        payload = jwt_backend().decode(token)
+        ttl = min(payload["exp"] - time.time(), token_cache.ttl)
+        if ttl > 0:
+            token_cache.set(digest, payload, ttl=ttl)
+    if any(is_revoked(payload) for is_revoked in revocation_hooks):
+        token_cache.pop(digest)
+        raise TokenError("Token revoked")
+    return payload
+
+
+def forget_token(token: str):
+    """Drops a token from the verified cache, e.g. after revoking it"""
+    token_cache.pop(_token_digest(token))
+
+
+async def authenticate_user(
     get_user: Callable, username: str, password: str
 ) -> Union[User, bool]:
-    """Authenticate the user"""
-    user = get_user(username)
+    """Authenticate the user, `get_user` is a coroutine function"""
+    user = await get_user(username)
     if not user:
         return False
-    if not verify_password(password, user.password):
+    if not await verify_password_async(password, user.password):
         return False
     return user
 
 
-def get_user(username: str) -> Optional[User]:
-    """Get user from database"""
-    query = select(User).where(User.username == username)
-    with Session(engine) as session:
-        return session.scalars(query).first()
-
-
-def get_current_user(
-    token: str = Depends(oauth2_scheme), request: Request = None, fresh=False
+async def load_user(username: str, session: AsyncSession) -> Optional[User]:
+    """Get user from the cache or, on a miss, through the request session
+
+    A new detached `User` is built on every hit so requests never share
+    (or expire) each other's instances.
+    """
+    data = user_cache.get(username)
+    if data is None:
+        query = select(User).where(User.username == username)
+        user = (await session.exec(query)).first()
+        if user is None:
+            return None
+        data = user.model_dump()
+        user_cache.set(username, data)
+    return User(**data)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_cached_user(mapper, connection, target: User):
+    """Drops a changed user, under the old username too if it was renamed"""
+    history = inspect(target).attrs.username.history
+    for username in (target.username, *history.deleted):
+        user_cache.pop(username)
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    request: Request = None,
+    fresh=False,
+    session: AsyncSession = AsyncActiveSession,
 ) -> User:
     """Get current user authenticated"""
     credentials_exception = HTTPException(
@@ -100,15 +177,15 @@ def get_current_user(
                 raise credentials_exception
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
 
         if username is None:
             raise credentials_exception
         token_data = TokenData(username=username)
-    except JWTError:
+    except TokenError:
         raise credentials_exception
-    user = get_user(username=token_data.username)
+    user = await load_user(token_data.username, session)
     if user is None:
         raise credentials_exception
     if fresh and (not payload["fresh"] and not user.superuser):
@@ -127,7 +204,10 @@ async def get_current_active_user(
 AuthenticatedUser = Depends(get_current_active_user)
 
 
-async def validate_token(token: str = Depends(oauth2_scheme)) -> User:
+async def validate_token(
+    token: str = Depends(oauth2_scheme),
+    session: AsyncSession = AsyncActiveSession,
+) -> User:
     """Validates user token"""
-    user = get_current_user(token=token)
+    user = await get_current_user(token=token, session=session)
     return user
\ No newline at end of file
@@ -1,19 +1,21 @@
-import typer
-from rich.console import Console
-from rich.table import Table
-from sqlmodel import Session, select
+import sys
 
-from .config import settings
-from .db import engine
-from .models import User, Post, SQLModel
-from .security import HashedPassword
+import typer
 
+# each command imports what it needs, `microblog --help` or `user-list`
+# should not pay for the web app, passlib or the search and export code
 main = typer.Typer(name="Microblog CLI")
 
 
 @main.command()
 def shell():
     """Opens interactive shell"""
+    from sqlmodel import Session, select
+
+    from .config import settings
+    from .db import engine
+    from .models import Post, User
+
     _vars = {
         "settings": settings,
         "engine": engine,
@@ -38,6 +40,13 @@ def shell():
 @main.command()
 def user_list():
     """Lists all users"""
+    from rich.console import Console
+    from rich.table import Table
+    from sqlmodel import Session, select
+
+    from .db import engine
+    from .models import User
+
     table = Table(title="Microblog users")
     fields = ["username", "email"]
     for header in fields:
@@ -54,6 +63,12 @@ def user_list():
 @main.command()
 def create_user(email: str, username: str, password: str):
     """Create user"""
+    from sqlmodel import Session
+
+    from .db import engine
+    from .models import User
+    from .security import HashedPassword
+
     with Session(engine) as session:
         user = User(
             email=email,
@@ -73,6 +88,150 @@ def reset_db(
     )
 ):
     """Resets the database tables"""
+    from .db import engine
+    from .models import SQLModel
+
     force = force or typer.confirm("Are you sure?")
     if force:
-        SQLModel.metadata.drop_all(engine)
\ No newline at end of file
+        SQLModel.metadata.drop_all(engine)
+
+
+@main.command()
+def timeline_rebuild():
+    """Rebuilds the materialized home timelines"""
+    from sqlmodel import Session
+
+    from . import timeline
+    from .db import engine
+
+    with Session(engine) as session:
+        rows = timeline.rebuild(session)
+        session.commit()
+    typer.echo(f"{rows} timeline entries written (mode={timeline.MODE})")
+
+
+@main.command()
+def reconcile_counters():
+    """Recomputes the like, reply and follower counters"""
+    from sqlmodel import Session
+
+    from . import counters, timeline
+    from .auth import user_cache
+    from .db import engine
+
+    with Session(engine) as session:
+        heavy = timeline.heavy_authors(session)
+        rows = counters.reconcile(session)
+        # authors back under FANOUT_MAX_FOLLOWERS were never fanned out
+        demoted = heavy - timeline.heavy_authors(session)
+        entries = timeline.materialize(session, demoted)
+        session.commit()
+    # only this process, the API workers' copies expire after their TTL
+    user_cache.clear()
+    for table, count in rows.items():
+        typer.echo(f"{count} {table} rows reconciled")
+    if demoted:
+        typer.echo(
+            f"{entries} timeline entries written for {len(demoted)} "
+            "authors below the fan-out limit"
+        )
+
+
+@main.command()
+def search_reindex():
+    """Rebuilds the full-text search index of posts"""
+    from sqlmodel import Session
+
+    from . import search
+    from .db import engine
+
+    with Session(engine) as session:
+        rows = search.rebuild(session)
+        session.commit()
+    typer.echo(f"{rows} posts indexed")
+
+
+@main.command()
+def tags_reindex():
+    """Parses the hashtags and mentions of every post again"""
+    from sqlmodel import Session
+
+    from . import tags
+    from .db import engine
+
+    with Session(engine) as session:
+        rows = tags.rebuild(session)
+        session.commit()
+    for table, count in rows.items():
+        typer.echo(f"{count} {table} rows written")
+
+
+@main.command("export")
+def export_user(
+    kind: str = typer.Argument(..., help="posts or likes"),
+    username: str = typer.Argument(...),
+    output: str = typer.Option(
+        "-", "--output", "-o", help="File, - for stdout"
+    ),
+    gzip: bool = typer.Option(False, help="Gzip the output"),
+):
+    """Exports a user's posts or likes as NDJSON"""
+    from sqlmodel import Session, select
+
+    from . import export
+    from .db import engine
+    from .models import User
+
+    if kind not in export.EXPORTS:
+        raise typer.BadParameter(f"choose from {', '.join(export.EXPORTS)}")
+    with Session(engine) as session:
+        user_id = session.exec(
+            select(User.id).where(User.username == username)
+        ).first()
+        if user_id is None:
+            typer.echo(f"user {username} not found", err=True)
+            raise typer.Exit(1)
+        query, fields = export.EXPORTS[kind](user_id)
+        chunks = export.iter_ndjson(session, query, fields)
+        if gzip:
+            chunks = export.gzipped(chunks)
+        out = sys.stdout.buffer if output == "-" else open(output, "wb")
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+
+
+@main.command()
+def seed(
+    users: int = typer.Option(1000, help="Number of users"),
+    posts: int = typer.Option(10000, help="Number of posts and replies"),
+    likes: int = typer.Option(20000, help="Number of likes (before dedupe)"),
+    follows: int = typer.Option(50, help="Average users followed"),
+    reply_ratio: float = typer.Option(0.3, help="Share of posts that reply"),
+    days: int = typer.Option(30, help="Posts are spread over this many days"),
+    password: str = typer.Option("microblog", help="Shared user password"),
+    prefix: str = typer.Option("seed", help="Username prefix"),
+    rng_seed: int = typer.Option(42, "--seed", help="Random generator seed"),
+    batch_size: int = typer.Option(10000, help="Rows per bulk insert"),
+):
+    """Generates a repeatable dataset for benchmarks"""
+    from .db import engine
+    from .seed import seed_database
+
+    seed_database(
+        engine,
+        users=users,
+        posts=posts,
+        likes=likes,
+        follows=follows,
+        reply_ratio=reply_ratio,
+        days=days,
+        password=password,
+        prefix=prefix,
+        seed=rng_seed,
+        batch_size=batch_size,
+        echo=typer.echo,
+    )
@@ -0,0 +1,65 @@
+"""Conditional GET (ETag and 304 Not Modified)
+
+Routes compute their ETag from the values that define the response and
+answer 304 when it matches `If-None-Match`. ETags are weak: they say the
+JSON means the same, not that it is byte for byte identical.
+
+There is no `Last-Modified`: likes, replies and follows change the
+responses without any row recording when, a date taken from the posts
+would let `If-Modified-Since` answer 304 for a stale copy.
+"""
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts: Any) -> str:
+    """Weak ETag from the repr of the values that define a resource"""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _opaque(tag: str) -> str:
+    """Drops the weak prefix, If-None-Match uses weak comparison"""
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+class Validators:
+    """ETag of one response"""
+
+    def __init__(self, etag: str, private: bool = False):
+        self.etag = etag
+        self.private = private
+
+    @property
+    def headers(self) -> dict:
+        return {
+            "ETag": self.etag,
+            # stored but revalidated on every use
+            "Cache-Control": "private, no-cache" if self.private else "no-cache",
+        }
+
+    def matches(self, request: Request) -> bool:
+        """True when the client's copy is current"""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is None:
+            return False
+        tags = {_opaque(tag) for tag in if_none_match.split(",")}
+        return "*" in tags or _opaque(self.etag) in tags
+
+    def not_modified(self) -> Response:
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=self.headers
+        )
+
+    def apply(self, result: Any, response: Response) -> Any:
+        """Adds the headers to what the route returns
+
+        Routes returning a `Response` skip the injected `response`, so
+        the headers go straight on theirs.
+        """
+        target = result if isinstance(result, Response) else response
+        target.headers.update(self.headers)
+        return result
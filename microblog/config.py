@@ -1,15 +1,217 @@
-"""Settings module"""
+"""Settings module
+
+`settings` is the Dynaconf object, it reads microblog/default.toml,
+settings.toml, .secrets.toml and `MICROBLOG_*` environment variables.
+`config` is a frozen, typed copy of it taken once at import, attribute
+access on it is a plain lookup instead of Dynaconf's layered one and a
+missing key fails at startup instead of in the middle of a request.
+Modules read their values from `config`; a new setting goes in
+default.toml and in its section below.
+"""
 import os
+import sys
+from dataclasses import dataclass, fields
+from typing import List, Optional, Tuple
 
 from dynaconf import Dynaconf
 
 HERE = os.path.dirname(os.path.abspath(__file__))
 
+
+def _parents(path: str) -> List[str]:
+    parents = [path]
+    while os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+        parents.append(path)
+    return parents
+
+
+def find_settings_files(*names: str) -> List[str]:
+    """Absolute paths of the settings files that exist
+
+    Same lookup as Dynaconf's (the folder of the invoked script, then
+    the working directory, each with its ./config and up to the root),
+    which calls `inspect.stack()` and reads the source of every frame
+    for each relative name, that is most of the time spent loading.
+    """
+    script = os.path.dirname(os.path.abspath(sys.argv[0] or "."))
+    folders = list(dict.fromkeys(_parents(script) + _parents(os.getcwd())))
+    found = []
+    for name in names:
+        for folder in folders:
+            candidates = [
+                os.path.join(folder, name),
+                os.path.join(folder, "config", name),
+            ]
+            path = next(filter(os.path.isfile, candidates), None)
+            if path is not None:
+                found.append(path)
+                break
+    return found
+
+
 settings = Dynaconf(
     envvar_prefix="microblog",
     preload=[os.path.join(HERE, "default.toml")],
-    settings_files=["settings.toml", ".secrets.toml"],
+    settings_files=find_settings_files("settings.toml", ".secrets.toml"),
     environments=["development", "production", "testing"],
     env_switcher="microblog_env",
     load_dotenv=False,
-)
\ No newline at end of file
+)
+
+
+@dataclass(frozen=True)
+class DBConfig:
+    uri: str
+    async_uri: str
+    connect_args: dict
+    echo: bool
+    null_pool: bool
+    pool_size: int
+    max_overflow: int
+    pool_timeout: float
+    pool_recycle: int
+    pool_pre_ping: bool
+    ping_timeout: float
+    replicas: Tuple[str, ...]
+    replica_strategy: str
+    sticky_seconds: float
+
+
+@dataclass(frozen=True)
+class SecurityConfig:
+    algorithm: str
+    access_token_expire_minutes: int
+    refresh_token_expire_minutes: int
+    hash_workers: int
+    hash_queue_limit: int
+    user_cache_size: int
+    user_cache_ttl: float
+    jwt_backend: str
+    token_cache_size: int
+    token_cache_ttl: float
+    # set in .secrets.toml or MICROBLOG_SECURITY__SECRET_KEY
+    secret_key: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class PaginationConfig:
+    default_limit: int
+    max_limit: int
+
+
+@dataclass(frozen=True)
+class TimelineConfig:
+    mode: str
+    fanout_max_followers: int
+    backfill_limit: int
+
+
+@dataclass(frozen=True)
+class ThreadConfig:
+    default_depth: int
+    max_depth: int
+
+
+@dataclass(frozen=True)
+class QueriesConfig:
+    server_timing: bool
+    strict: bool
+    strict_action: str
+    budget: int
+    repeat_limit: int
+
+
+@dataclass(frozen=True)
+class MetricsConfig:
+    latency_buckets: Tuple[float, ...]
+    loop_lag_interval: float
+    pool_wait_buckets: Tuple[float, ...]
+
+
+@dataclass(frozen=True)
+class ResponsesConfig:
+    fast_json: bool
+
+
+@dataclass(frozen=True)
+class CacheConfig:
+    enabled: bool
+    backend: str
+    size: int
+    ttl: float
+    redis_url: str
+
+
+@dataclass(frozen=True)
+class SearchConfig:
+    config: str
+
+
+@dataclass(frozen=True)
+class ExportConfig:
+    yield_per: int
+    gzip_level: int
+
+
+@dataclass(frozen=True)
+class LiveConfig:
+    broker: str
+    channel: str
+    queue_size: int
+    heartbeat: float
+
+
+@dataclass(frozen=True)
+class RateLimitConfig:
+    enabled: bool
+    backend: str
+    size: int
+    redis_url: str
+    # limit name -> {rate, per, burst, by}
+    limits: dict
+
+
+@dataclass(frozen=True)
+class Config:
+    db: DBConfig
+    security: SecurityConfig
+    pagination: PaginationConfig
+    timeline: TimelineConfig
+    thread: ThreadConfig
+    queries: QueriesConfig
+    metrics: MetricsConfig
+    responses: ResponsesConfig
+    cache: CacheConfig
+    search: SearchConfig
+    export: ExportConfig
+    live: LiveConfig
+    ratelimit: RateLimitConfig
+
+
+def _plain(value):
+    """Dynaconf boxes and lists as dicts and tuples"""
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return tuple(_plain(item) for item in value)
+    return value
+
+
+def freeze(source: Dynaconf) -> Config:
+    """Reads every section of `source` into a `Config`"""
+    sections = {}
+    for section in fields(Config):
+        # toml keys are upper or lower case, Dynaconf ignores it
+        values = {
+            key.lower(): value
+            for key, value in (source.get(section.name) or {}).items()
+        }
+        names = [field.name for field in fields(section.type)]
+        sections[section.name] = section.type(**{
+            name: _plain(values[name]) for name in names if name in values
+        })
+    return Config(**sections)
+
+
+config = freeze(settings)
@@ -0,0 +1,65 @@
+"""Denormalized counters
+
+The counters are updated with atomic `col = col + n` statements in the
+same transaction as the write they count, `reconcile` recomputes all of
+them from the source tables.
+"""
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+
+from microblog.models.like import Like
+from microblog.models.post import Post
+from microblog.models.social import Social
+from microblog.models.user import User
+
+
+def increment(column, *where, by: int = 1):
+    """UPDATE <table> SET column = column + by WHERE ..."""
+    model = column.class_
+    return (
+        update(model)
+        .where(*where)
+        .values({column.key: column + by})
+        .execution_options(synchronize_session=False)
+    )
+
+
+def count_follow(follower_id: int, followee_id: int, by: int = 1):
+    """Updates both sides of a follow in a single statement"""
+    return (
+        update(User)
+        .where(User.id.in_((follower_id, followee_id)))
+        .values(
+            follower_count=User.follower_count
+            + case((User.id == followee_id, by), else_=0),
+            following_count=User.following_count
+            + case((User.id == follower_id, by), else_=0),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reconcile(session: Session) -> dict:
+    """Recomputes every counter, returns the rows updated per table"""
+    reply = aliased(Post)
+    posts = update(Post).values(
+        like_count=select(func.count(Like.id))
+        .where(Like.post_id == Post.id)
+        .scalar_subquery(),
+        reply_count=select(func.count(reply.id))
+        .where(reply.parent_id == Post.id)
+        .scalar_subquery(),
+    )
+    users = update(User).values(
+        follower_count=select(func.count(Social.id))
+        .where(Social.to_user_id == User.id)
+        .scalar_subquery(),
+        following_count=select(func.count(Social.id))
+        .where(Social.from_user_id == User.id)
+        .scalar_subquery(),
+    )
+    return {
+        "post": session.exec(posts).rowcount,
+        "user": session.exec(users).rowcount,
+    }
@@ -1,19 +1,236 @@
-"""Database connection"""
-from fastapi import Depends
+"""Database connection
+
+The FastAPI session dependencies are in `microblog.dependencies`, this
+module is also imported by the CLI and migrations, which have no use
+for the web framework.
+"""
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, List
+
+from sqlalchemy import event, exc
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from sqlmodel import Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .cache import TTLCache
+from .config import config
+
+if TYPE_CHECKING:
+    from starlette.requests import Request
+
+# asyncio driver used for each sync database backend
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def get_async_uri(uri: str) -> str:
+    """Swaps the driver of a database uri for its asyncio counterpart"""
+    url = make_url(uri)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+class TimedPool:
+    """Counts how long checkouts wait for a connection, and timeouts
+
+    The wait includes opening a new connection when the pool has none
+    idle. `wait_observers` are called with the seconds waited.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_observers: List[Callable[[float], None]] = []
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            for observe in self.wait_observers:
+                observe(waited)
+
+    def recreate(self):
+        """`engine.dispose()` swaps the pool, keep the observers"""
+        pool = super().recreate()
+        pool.wait_observers = self.wait_observers
+        return pool
+
+
+class TimedQueuePool(TimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(uri: str, poolclass: type) -> dict:
+    """create_engine pool arguments from the `db` section"""
+    options = {
+        "pool_pre_ping": config.db.pool_pre_ping,
+        "pool_recycle": config.db.pool_recycle,
+    }
+    url = make_url(uri)
+    # in memory sqlite is a single connection per thread, nothing to size
+    if url.get_backend_name() == "sqlite" and url.database in (
+        None, "", ":memory:"
+    ):
+        return options
+    options.update(
+        poolclass=poolclass,
+        pool_size=config.db.pool_size,
+        max_overflow=config.db.max_overflow,
+        pool_timeout=config.db.pool_timeout,
+    )
+    return options
+
+
+def pool_stats(engine: Engine) -> dict:
+    """Connections of an engine's pool, in use and idle"""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"class": type(pool).__name__}
+    return {
+        "class": type(pool).__name__,
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # negative until the pool has opened `size` connections
+        "overflow": max(pool.overflow(), 0),
+        "timeouts": getattr(pool, "timeouts", 0),
+    }
 
-from .config import settings
 
 engine = create_engine(
-    settings.db.uri,
-    echo=settings.db.echo,
-    connect_args=settings.db.connect_args,
+    config.db.uri,
+    echo=config.db.echo,
+    connect_args=config.db.connect_args,
+    **pool_options(config.db.uri, TimedQueuePool),
+)
+
+
+def make_async_engine(uri: str) -> AsyncEngine:
+    return create_async_engine(
+        uri,
+        echo=config.db.echo,
+        connect_args=config.db.connect_args,
+        # pooled asyncio connections are bound to the loop that opened them
+        **(
+            {"poolclass": NullPool}
+            if config.db.null_pool
+            else pool_options(uri, TimedAsyncAdaptedQueuePool)
+        ),
+    )
+
+
+async_engine = make_async_engine(
+    config.db.async_uri or get_async_uri(config.db.uri)
 )
+replica_engines = [
+    make_async_engine(get_async_uri(uri)) for uri in config.db.replicas
+]
+
+
+class ReplicaRouter:
+    """Picks the engine of each request session
+
+    GET and HEAD requests read from a replica, anything else uses the
+    primary. After a write, the requests with the same Authorization
+    header keep reading from the primary for `sticky_seconds`, so users
+    see their own writes whatever the replication lag. That memory is
+    per process, with several workers a write is only sticky on the
+    worker that served it, keep the window above the usual lag anyway.
+    A lagging replica read right after a write may also be stored by
+    the response cache, for at most `cache.ttl` seconds.
+
+    Strategies: "round_robin", or "least_loaded" for the replica with
+    the fewest sessions open.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: List[AsyncEngine],
+        strategy: str = "round_robin",
+        sticky_seconds: float = 5,
+    ):
+        if strategy not in ("round_robin", "least_loaded"):
+            raise RuntimeError(f"Unknown replica strategy {strategy!r}")
+        self.primary = primary
+        self.replicas = replicas
+        self.strategy = strategy
+        self.writers = TTLCache(maxsize=100_000, ttl=sticky_seconds)
+        self.open_sessions: Dict[AsyncEngine, int] = dict.fromkeys(
+            [primary, *replicas], 0
+        )
+        self._turn = itertools.count()
+
+    def choose_replica(self) -> AsyncEngine:
+        if self.strategy == "least_loaded":
+            return min(self.replicas, key=self.open_sessions.__getitem__)
+        return self.replicas[next(self._turn) % len(self.replicas)]
+
+    def engine_for(self, request: "Request") -> AsyncEngine:
+        if not self.replicas or request.method not in ("GET", "HEAD"):
+            return self.primary
+        if request.headers.get("authorization") in self.writers:
+            return self.primary
+        return self.choose_replica()
+
+    def wrote(self, request: "Request"):
+        writer = request.headers.get("authorization")
+        if writer is not None:
+            self.writers.set(writer, True)
+
+    @asynccontextmanager
+    async def session(
+        self, request: "Request"
+    ) -> AsyncIterator[AsyncSession]:
+        bind = self.engine_for(request)
+        self.open_sessions[bind] += 1
+        try:
+            # objects stay loaded after commit, refreshing them would
+            # need IO
+            async with AsyncSession(bind, expire_on_commit=False) as session:
+                yield session
+                if session.sync_session.info.get("committed"):
+                    self.wrote(request)
+        finally:
+            self.open_sessions[bind] -= 1
+
+
+replica_router = ReplicaRouter(
+    async_engine,
+    replica_engines,
+    config.db.replica_strategy,
+    config.db.sticky_seconds,
+)
+
 
+@event.listens_for(Session, "after_commit")
+def _mark_committed(session):
+    session.info["committed"] = True
 
-def get_session():
-    with Session(engine) as session:
-        yield session
 
+def insert_or_ignore(session, table, values: dict):
+    """Builds INSERT ... ON CONFLICT DO NOTHING for the session's database
 
-ActiveSession = Depends(get_session)
\ No newline at end of file
+    Executing it gives a rowcount of 0 when the row already existed, so
+    a unique index replaces a SELECT followed by an INSERT.
+    """
+    dialects = {"postgresql": postgresql, "sqlite": sqlite}
+    dialect = dialects[session.bind.dialect.name]
+    return dialect.insert(table).values(values).on_conflict_do_nothing()
@@ -0,0 +1,19 @@
+"""Database sessions as FastAPI dependencies"""
+from fastapi import Depends, Request
+from sqlmodel import Session
+
+from microblog import db
+
+
+def get_session():
+    with Session(db.engine) as session:
+        yield session
+
+
+async def get_async_session(request: Request):
+    async with db.replica_router.session(request) as session:
+        yield session
+
+
+ActiveSession = Depends(get_session)
+AsyncActiveSession = Depends(get_async_session)
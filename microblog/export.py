@@ -0,0 +1,118 @@
+"""Streaming NDJSON exports of a user's posts and likes
+
+Rows are fetched through a server-side cursor `YIELD_PER` at a time
+(asyncpg and psycopg2 keep the rest on the server) and each batch is
+encoded and written before the next one is read, so memory stays flat
+whatever the size of the account. One JSON object per line, with the
+fields of `PostResponse`, likes add `liked_at`.
+
+The HTTP stream opens its own session: the request's one is closed as
+soon as the endpoint returns, before the body is sent.
+"""
+import zlib
+from typing import AsyncIterator, Iterable, Iterator, List, Sequence, Tuple
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from microblog.config import config
+from microblog.db import async_engine
+from microblog.models.like import Like
+from microblog.models.post import Post
+from microblog.responses import POST_FIELDS, dumps, projection
+
+YIELD_PER = config.export.yield_per
+GZIP_LEVEL = config.export.gzip_level
+
+LIKE_FIELDS = POST_FIELDS + ["liked_at"]
+
+
+def posts_query(user_id: int) -> Tuple[Select, List[str]]:
+    """Posts and replies of a user, oldest first"""
+    query = (
+        projection(Post, POST_FIELDS)
+        .where(Post.user_id == user_id)
+        .order_by(Post.date, Post.id)
+    )
+    return query, POST_FIELDS
+
+
+def likes_query(user_id: int) -> Tuple[Select, List[str]]:
+    """Posts liked by a user, in the order they were liked"""
+    query = (
+        projection(Post, POST_FIELDS)
+        .add_columns(Like.date.label("liked_at"))
+        .join(Like, Like.post_id == Post.id)
+        .where(Like.user_id == user_id)
+        .order_by(Like.date, Like.id)
+    )
+    return query, LIKE_FIELDS
+
+
+EXPORTS = {
+    "posts": posts_query,
+    "likes": likes_query,
+}
+
+
+def encode_batch(rows: Iterable[Sequence], fields: Sequence[str]) -> bytes:
+    return b"".join(dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+
+
+def gzipped(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def agzipped(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def stream_ndjson(
+    query: Select, fields: Sequence[str]
+) -> AsyncIterator[bytes]:
+    """NDJSON chunks of `query`, one per `YIELD_PER` rows"""
+    async with AsyncSession(async_engine) as session:
+        result = await session.stream(
+            query.execution_options(yield_per=YIELD_PER)
+        )
+        async for rows in result.partitions():
+            yield encode_batch(rows, fields)
+
+
+def ndjson_response(
+    query: Select, fields: Sequence[str], filename: str, compress: bool
+) -> StreamingResponse:
+    """Streams `query` as an NDJSON download, gzipped if `compress`"""
+    chunks = stream_ndjson(query, fields)
+    media_type = "application/x-ndjson"
+    filename = f"{filename}.ndjson"
+    if compress:
+        chunks = agzipped(chunks)
+        media_type = "application/gzip"
+        filename += ".gz"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def iter_ndjson(
+    session: Session, query: Select, fields: Sequence[str]
+) -> Iterator[bytes]:
+    """`stream_ndjson` for the CLI, on the sync engine"""
+    result = session.execute(query.execution_options(yield_per=YIELD_PER))
+    for rows in result.partitions():
+        yield encode_batch(rows, fields)
@@ -0,0 +1,157 @@
+"""Per request SQL statistics
+
+`QueryStatsMiddleware` opens a `RequestStats` for every HTTP request in
+a context variable. Engine events add each statement to it, the variable
+follows the request through the asyncio greenlets and the threadpool, so
+concurrent requests never mix their numbers. The totals are sent back
+in a `Server-Timing` header, which browsers show in the network panel:
+
+    Server-Timing: db;dur=4.21;desc="3 queries", app;dur=11.70
+
+Strict mode checks each statement against `queries.budget` and counts
+repeated statement shapes, the usual sign of an N+1 lazy load.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+
+from microblog.config import config
+from microblog.db import async_engine, engine, replica_engines
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING = config.queries.server_timing
+STRICT = config.queries.strict
+STRICT_ACTION = config.queries.strict_action
+BUDGET = config.queries.budget
+REPEAT_LIMIT = config.queries.repeat_limit
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised in strict mode when a request runs too many statements"""
+
+
+class RequestStats:
+    """Statements run while serving one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: Counter = Counter()
+        self.violations: List[str] = []
+
+    def check(self, shape: str):
+        """Strict mode rules, called before each statement runs"""
+        problems = []
+        if self.count > BUDGET:
+            problems.append(f"more than {BUDGET} queries")
+        if self.shapes[shape] == REPEAT_LIMIT:
+            problems.append(
+                f"statement repeated {REPEAT_LIMIT} times: {shape[:200]}"
+            )
+        for problem in problems:
+            if STRICT_ACTION == "raise":
+                raise QueryBudgetExceeded(problem)
+            if problem not in self.violations:
+                self.violations.append(problem)
+
+
+current_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_stats", default=None
+)
+
+_IN_LIST = re.compile(r"\bIN \([^)]*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Statement text with expanded IN lists collapsed
+
+    Parameters are already bound separately, so the same query with
+    other values has the same text.
+    """
+    return _IN_LIST.sub("IN (...)", _SPACES.sub(" ", statement))
+
+
+def _before_cursor_execute(conn, cursor, statement, params, context, many):
+    stats = current_stats.get()
+    if stats is None:
+        return
+    shape = statement_shape(statement)
+    stats.count += 1
+    stats.shapes[shape] += 1
+    if STRICT:
+        stats.check(shape)
+    # on the execution context, which a failed statement drops with it
+    if context is not None:
+        context.query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, params, context, many):
+    stats = current_stats.get()
+    started = getattr(context, "query_started", None)
+    if stats is None or started is None:
+        return
+    stats.duration += time.perf_counter() - started
+
+
+for _engine in (
+    engine,
+    async_engine.sync_engine,
+    *(replica.sync_engine for replica in replica_engines),
+):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def server_timing(stats: RequestStats, elapsed: float) -> bytes:
+    return (
+        f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries", '
+        f"app;dur={elapsed * 1000:.2f}"
+    ).encode("latin-1")
+
+
+class QueryStatsMiddleware:
+    """Collects the statements of each request
+
+    A plain ASGI middleware, it only wraps `send` to add the header
+    and leaves the body streaming untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and SERVER_TIMING:
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"server-timing",
+                    server_timing(stats, time.perf_counter() - started),
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_stats.reset(token)
+            if stats.violations:
+                route = scope.get("route")
+                path = getattr(route, "path", scope["path"])
+                for problem in stats.violations:
+                    logger.warning(
+                        "%s %s: %s", scope["method"], path, problem
+                    )
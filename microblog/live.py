@@ -0,0 +1,324 @@
+"""Live timeline, new posts pushed to the followers that are connected
+
+`create_post` publishes each post to the broker once it is committed.
+The broker hands it to the `hub` of every process, which puts it in the
+queue of each local subscriber following its author. Subscribers are
+`/user/timeline/stream` (server-sent events) and `/user/timeline/ws`
+(WebSocket) connections.
+
+Brokers (`live.broker`):
+
+- "memory": delivers to the hub of this process only, enough with a
+  single worker and in tests.
+- "postgres": NOTIFY on the `live.channel` channel and one LISTEN
+  connection per process (asyncpg). Notifications carry ids only, each
+  process loads a post if somebody connected to it follows its author.
+  A dropped LISTEN connection is reopened, with a growing delay up to
+  RECONNECT_MAX_DELAY seconds; posts notified meanwhile are not pushed.
+
+Publishing never waits for subscribers. A queue holds `live.queue_size`
+posts, a subscriber falling further behind is sent an "overflow" event
+and disconnected, it should reload `/user/timeline` before reconnecting.
+The followed authors are read when connecting, follows made after that
+show up on the next connection.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket, status
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from microblog.config import config
+from microblog.db import async_engine
+from microblog.models.post import Post
+from microblog.responses import POST_FIELDS, dumps, projection
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = config.live.queue_size
+HEARTBEAT = config.live.heartbeat
+# seconds between attempts to reopen the LISTEN connection
+RECONNECT_DELAY = 1
+RECONNECT_MAX_DELAY = 30
+
+# put in a queue instead of a post when its subscriber fell behind
+OVERFLOW = None
+
+
+def post_event(post) -> dict:
+    """The JSON pushed for a post, same fields as `PostResponse`"""
+    return {name: getattr(post, name) for name in POST_FIELDS}
+
+
+class Subscription:
+    """Bounded queue of the posts one connection has to send"""
+
+    def __init__(self, following: Iterable[int], size: int):
+        self.following = set(following)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+        self.loop = asyncio.get_running_loop()
+
+    def put(self, post: dict):
+        """Queues a post without waiting, from any thread or loop"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._put(post)
+        else:
+            self.loop.call_soon_threadsafe(self._put, post)
+
+    def _put(self, post: dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(post)
+        except asyncio.QueueFull:
+            # drop the backlog, the client resyncs from /user/timeline
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    async def get(self) -> Optional[dict]:
+        """Next post, `OVERFLOW` once the subscriber fell behind"""
+        return await self.queue.get()
+
+
+class Hub:
+    """Subscriptions of this process indexed by followed author"""
+
+    def __init__(self):
+        self.by_author: Dict[int, Set[Subscription]] = {}
+
+    @property
+    def subscribers(self) -> int:
+        return len(set().union(*self.by_author.values()))
+
+    @asynccontextmanager
+    async def subscribe(
+        self, following: Iterable[int], size: Optional[int] = None
+    ) -> AsyncIterator[Subscription]:
+        subscription = Subscription(following, size or QUEUE_SIZE)
+        for author_id in subscription.following:
+            self.by_author.setdefault(author_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            for author_id in subscription.following:
+                subscribers = self.by_author.get(author_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.by_author[author_id]
+
+    def wants(self, author_id: int) -> bool:
+        return author_id in self.by_author
+
+    def dispatch(self, post: dict) -> int:
+        """Queues a post for its author's followers, returns how many"""
+        subscribers = list(self.by_author.get(post["user_id"], ()))
+        for subscription in subscribers:
+            subscription.put(post)
+        return len(subscribers)
+
+
+hub = Hub()
+
+
+class MemoryBroker:
+    """Publishes straight to the hub of this process"""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, post: dict):
+        hub.dispatch(post)
+
+
+class PostgresBroker:
+    """Publishes with NOTIFY, every process LISTENs with asyncpg"""
+
+    def __init__(self):
+        try:
+            import asyncpg
+        except ImportError:
+            raise RuntimeError(
+                "live.broker = 'postgres' needs `pip install asyncpg`"
+            )
+
+        self.asyncpg = asyncpg
+        self.channel = config.live.channel
+        self.dsn = (
+            make_url(config.db.uri)
+            .set(drivername="postgresql")
+            .render_as_string(hide_password=False)
+        )
+        self.listener = None
+        self.reconnecting: Optional[asyncio.Task] = None
+        self.stopping = False
+        # the loop only keeps weak references to tasks
+        self.deliveries: Set[asyncio.Task] = set()
+
+    async def start(self):
+        self.stopping = False
+        await self._listen()
+
+    async def stop(self):
+        self.stopping = True
+        if self.reconnecting is not None:
+            self.reconnecting.cancel()
+            self.reconnecting = None
+        for task in list(self.deliveries):
+            task.cancel()
+        if self.listener is not None:
+            await self.listener.close()
+            self.listener = None
+
+    async def _listen(self):
+        self.listener = await self.asyncpg.connect(self.dsn)
+        self.listener.add_termination_listener(self._terminated)
+        await self.listener.add_listener(self.channel, self._notified)
+
+    def _terminated(self, connection):
+        if self.stopping or self.reconnecting is not None:
+            return
+        logger.warning("live LISTEN connection lost, reconnecting")
+        self.listener = None
+        self.reconnecting = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        delay = RECONNECT_DELAY
+        try:
+            while not self.stopping:
+                try:
+                    await self._listen()
+                    logger.info("live LISTEN connection restored")
+                    return
+                except Exception:
+                    logger.exception(
+                        "live LISTEN reconnect failed, next in %ss", delay
+                    )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        finally:
+            self.reconnecting = None
+
+    async def publish(self, post: dict):
+        payload = f"{post['id']}:{post['user_id']}"
+        async with async_engine.connect() as connection:
+            await connection.execute(
+                select(func.pg_notify(self.channel, payload))
+            )
+            await connection.commit()
+
+    def _notified(self, connection, pid, channel, payload: str):
+        post_id, author_id = map(int, payload.split(":"))
+        if hub.wants(author_id):
+            task = asyncio.ensure_future(self._deliver(post_id))
+            self.deliveries.add(task)
+            task.add_done_callback(self.deliveries.discard)
+
+    async def _deliver(self, post_id: int):
+        try:
+            async with AsyncSession(async_engine) as session:
+                query = projection(Post, POST_FIELDS).where(Post.id == post_id)
+                post = (await session.exec(query)).first()
+        except Exception:
+            logger.exception("could not load post %s for live push", post_id)
+            return
+        if post is not None:
+            hub.dispatch(post_event(post))
+
+
+BROKERS = {
+    "memory": MemoryBroker,
+    "postgres": PostgresBroker,
+}
+
+
+def get_broker(name: str):
+    """Instantiates the broker configured in `live.broker`"""
+    try:
+        broker = BROKERS[name]
+    except KeyError:
+        raise RuntimeError(f"Unknown live broker {name!r}")
+    return broker()
+
+
+broker = get_broker(config.live.broker)
+
+
+async def publish(post: Post):
+    """Pushes a committed post to the connected followers of its author"""
+    try:
+        await broker.publish(post_event(post))
+    except Exception:
+        # the post is saved, live delivery is best effort
+        logger.exception("could not publish post %s", post.id)
+
+
+def sse_message(post: Optional[dict]) -> bytes:
+    if post is OVERFLOW:
+        return b"event: overflow\ndata: {}\n\n"
+    return b"id: %d\nevent: post\ndata: %s\n\n" % (post["id"], dumps(post))
+
+
+async def sse_stream(following: Iterable[int]) -> AsyncIterator[bytes]:
+    """Server-sent events for the posts of `following`
+
+    A comment is sent every `HEARTBEAT` seconds without posts so proxies
+    keep the connection open.
+    """
+    async with hub.subscribe(following) as subscription:
+        yield b"retry: 5000\n\n"
+        while True:
+            try:
+                post = await asyncio.wait_for(subscription.get(), HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            yield sse_message(post)
+            if post is OVERFLOW:
+                return
+
+
+async def websocket_stream(websocket: WebSocket, following: Iterable[int]):
+    """Accepts the socket and sends the posts of `following` as JSON
+    until the client leaves"""
+
+    async def watch():
+        # messages from the client are ignored, reading notices it left
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    async with hub.subscribe(following) as subscription:
+        await websocket.accept()
+        watcher = asyncio.ensure_future(watch())
+        try:
+            while True:
+                getter = asyncio.ensure_future(subscription.get())
+                await asyncio.wait(
+                    {getter, watcher}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not getter.done():
+                    getter.cancel()
+                    return
+                post = getter.result()
+                if post is OVERFLOW:
+                    await websocket.send_json({"event": "overflow"})
+                    await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                    return
+                message = dumps({"event": "post", "data": post})
+                await websocket.send_text(message.decode())
+        finally:
+            watcher.cancel()
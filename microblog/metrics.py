@@ -0,0 +1,349 @@
+"""Prometheus metrics
+
+A small registry rendering the Prometheus text format, so `/metrics`
+needs no extra dependency. Recording is meant to stay on under load:
+
+- counters and histograms are plain dicts of label tuples updated from
+  the event loop thread, no locks are taken (the GIL keeps a scrape
+  from seeing a torn value, at worst it misses the latest increment);
+- histogram buckets are fixed up front, an observation is one bisect
+  and two additions, cumulative counts are only built when scraped;
+- pool and bcrypt gauges are read from their owners at scrape time.
+"""
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import event
+
+from microblog.config import config
+from microblog.db import async_engine, engine, replica_engines
+from microblog.live import hub
+from microblog.ratelimit import throttled
+from microblog.security import hashing_pool
+
+LOOP_LAG_INTERVAL = config.metrics.loop_lag_interval
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def _labels(names: Sequence[str], values: Iterable) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+
+    @abstractmethod
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """(name suffix, rendered labels, value) of each sample"""
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for key, value in list(self._values.items()):
+            yield "", _labels(self.labelnames, key), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class CallbackGauge(Metric):
+    """Gauge whose values are read when scraped
+
+    `callback` returns a mapping of label tuples to values.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels, callback: Callable[[], dict]):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def samples(self):
+        for key, value in self.callback().items():
+            yield "", _labels(self.labelnames, key), value
+
+
+class CallbackCounter(CallbackGauge):
+    kind = "counter"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets: Sequence[float] = ()):
+        super().__init__(name, help, labels)
+        self.buckets = sorted(buckets)
+        # per label tuple: [count per bucket..., overflow count, sum]
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        slots = self._values.get(labels)
+        if slots is None:
+            slots = self._values.setdefault(
+                labels, [0] * (len(self.buckets) + 2)
+            )
+        slots[bisect_left(self.buckets, value)] += 1
+        slots[-1] += value
+
+    def snapshot(self, *labels: str) -> dict:
+        """Cumulative bucket counts, sum and count of one label tuple"""
+        slots = list(self._values.get(labels, [0] * (len(self.buckets) + 2)))
+        buckets, cumulative = {}, 0
+        for bound, count in zip(self.buckets + [float("inf")], slots):
+            cumulative += count
+            buckets[_number(bound)] = cumulative
+        return {"buckets": buckets, "sum": slots[-1], "count": cumulative}
+
+    def samples(self):
+        for key, slots in list(self._values.items()):
+            slots = list(slots)
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float("inf")], slots):
+                cumulative += count
+                labels = _labels(
+                    self.labelnames + ("le",), key + (_number(bound),)
+                )
+                yield "_bucket", labels, cumulative
+            labels = _labels(self.labelnames, key)
+            yield "_sum", labels, slots[-1]
+            yield "_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "microblog_http_requests_total",
+    "HTTP responses by route template and status",
+    ["method", "route", "status"],
+))
+LATENCY = registry.register(Histogram(
+    "microblog_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route"],
+    buckets=config.metrics.latency_buckets,
+))
+IN_PROGRESS = registry.register(Gauge(
+    "microblog_http_requests_in_progress",
+    "HTTP requests being served",
+))
+LOOP_LAG = registry.register(Gauge(
+    "microblog_event_loop_lag_seconds",
+    "Delay of the last event loop heartbeat",
+))
+LOOP_LAG_HISTOGRAM = registry.register(Histogram(
+    "microblog_event_loop_lag_distribution_seconds",
+    "Delays of the event loop heartbeats",
+    buckets=config.metrics.latency_buckets,
+))
+
+# connection pools, "sync" for `engine`, "async" for `async_engine` and
+# "replicaN" for the read replicas
+ENGINES = {"sync": engine, "async": async_engine.sync_engine}
+ENGINES.update(
+    (f"replica{n}", replica.sync_engine)
+    for n, replica in enumerate(replica_engines)
+)
+POOL_CHECKOUTS = registry.register(Counter(
+    "microblog_db_pool_checkouts_total",
+    "Connections handed out by the pool",
+    ["engine"],
+))
+
+
+def _pool_gauge(method: str) -> Callable[[], dict]:
+    def read():
+        values = {}
+        for name, eng in ENGINES.items():
+            # NullPool keeps no connections and has no sizes to report
+            if hasattr(eng.pool, method):
+                values[(name,)] = getattr(eng.pool, method)()
+        return values
+
+    return read
+
+
+for _method, _help in [
+    ("size", "Connections the pool keeps open"),
+    ("checkedout", "Connections in use"),
+    ("checkedin", "Idle connections in the pool"),
+    ("overflow", "Connections opened beyond the pool size"),
+]:
+    registry.register(CallbackGauge(
+        f"microblog_db_pool_{_method}", _help, ["engine"], _pool_gauge(_method)
+    ))
+
+POOL_WAIT = registry.register(Histogram(
+    "microblog_db_pool_wait_seconds",
+    "Time checkouts waited for a connection, opening included",
+    ["engine"],
+    buckets=config.metrics.pool_wait_buckets,
+))
+registry.register(CallbackCounter(
+    "microblog_db_pool_timeouts_total",
+    "Checkouts that gave up after db.pool_timeout",
+    ["engine"],
+    lambda: {
+        (name,): eng.pool.timeouts
+        for name, eng in ENGINES.items()
+        if hasattr(eng.pool, "timeouts")
+    },
+))
+
+for _name, _engine in ENGINES.items():
+    event.listen(
+        _engine,
+        "checkout",
+        lambda *args, _name=_name: POOL_CHECKOUTS.inc(_name),
+    )
+    if hasattr(_engine.pool, "wait_observers"):
+        _engine.pool.wait_observers.append(
+            lambda seconds, _name=_name: POOL_WAIT.observe(seconds, _name)
+        )
+
+
+def _hashing_stats(key: str) -> Callable[[], dict]:
+    return lambda: {(): hashing_pool.stats()[key]}
+
+
+registry.register(CallbackGauge(
+    "microblog_hash_pool_running", "bcrypt calls running", [],
+    _hashing_stats("running"),
+))
+registry.register(CallbackGauge(
+    "microblog_hash_pool_queued", "bcrypt calls waiting for a thread", [],
+    _hashing_stats("queued"),
+))
+registry.register(CallbackCounter(
+    "microblog_hash_pool_completed_total", "bcrypt calls finished", [],
+    _hashing_stats("completed"),
+))
+registry.register(CallbackCounter(
+    "microblog_hash_pool_rejected_total", "bcrypt calls refused with 503", [],
+    _hashing_stats("rejected"),
+))
+
+registry.register(CallbackCounter(
+    "microblog_ratelimit_throttled_total",
+    "Requests refused with 429 by rate limit",
+    ["limit"],
+    lambda: {(name,): count for name, count in throttled.items()},
+))
+
+registry.register(CallbackGauge(
+    "microblog_live_subscribers", "open live timeline connections", [],
+    lambda: {(): hub.subscribers},
+))
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """Sleeps `interval` in a loop and records how late each wake up is
+
+    Anything blocking the event loop (sync IO, CPU work) shows up here.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+class MetricsMiddleware:
+    """Records latency and status of each request by route template
+
+    Routes are labelled with their template (`/post/{post_id}/`) so ids
+    do not blow up the number of series, unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_PROGRESS.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            REQUESTS.inc(method, route, status)
+            LATENCY.observe(elapsed, method, route)
@@ -3,5 +3,9 @@ from microblog.models.user import User
 from microblog.models.post import Post
 from microblog.models.social import Social
 from microblog.models.like import Like
+from microblog.models.timeline import TimelineEntry
+from microblog.models.tag import PostMention, PostTag
+from microblog.models import search  # noqa: F401, creates post_search
 
-__all__ = ["SQLModel", "User", "Post", "Social", "Like"]
\ No newline at end of file
+__all__ = ["SQLModel", "User", "Post", "Social", "Like", "TimelineEntry",
+           "PostTag", "PostMention"]
\ No newline at end of file
@@ -1,7 +1,9 @@
 from typing import Optional, TYPE_CHECKING
-from datetime import datetime, timezone
+from datetime import datetime
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+
+from microblog.models.utils import utcnow
 
 if TYPE_CHECKING:
     from microblog.models.user import User
@@ -10,6 +12,11 @@ if TYPE_CHECKING:
 class Like(SQLModel, table=True):
     """Modelo que representa o like de um usuário em um post"""
     
+    __table_args__ = (
+        Index("uq_like_user_post", "user", "post", unique=True),
+        Index("ix_like_post", "post"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(
         sa_column=Column("user", Integer, ForeignKey("user.id"))
@@ -18,7 +25,7 @@ class Like(SQLModel, table=True):
         sa_column=Column("post", Integer, ForeignKey("post.id"))
     )
     date: datetime = Field(
-        default_factory=lambda: datetime.now(timezone.utc),
+        default_factory=utcnow,
         sa_column=Column(DateTime, name="date")
     )
     
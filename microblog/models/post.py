@@ -1,9 +1,11 @@
-from datetime import datetime, timezone
+from datetime import datetime
 from typing import TYPE_CHECKING, Optional
 
 from pydantic import BaseModel
 from sqlmodel import Field, Relationship, SQLModel
-from sqlalchemy import Column
+from sqlalchemy import Column, Index, text
+
+from microblog.models.utils import utcnow
 
 if TYPE_CHECKING:
     from microblog.models.user import User
@@ -13,16 +15,39 @@ if TYPE_CHECKING:
 class Post(SQLModel, table=True):
     """Represents the Post Model"""
 
+    __table_args__ = (
+        # posts by author and timeline reads, newest first
+        Index("ix_post_user_date", "user_id", "date", "id"),
+        # replies of a post
+        Index("ix_post_parent_date", "parent_id", "date", "id"),
+        # listing of top level posts
+        Index(
+            "ix_post_root_date",
+            "date",
+            "id",
+            postgresql_where=text("parent_id IS NULL"),
+            sqlite_where=text("parent_id IS NULL"),
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     text: str
     date: datetime = Field(
-        default_factory=lambda: datetime.now(timezone.utc),
+        default_factory=utcnow,
         nullable=False
     )
 
     user_id: Optional[int] = Field(foreign_key="user.id")
     parent_id: Optional[int] = Field(foreign_key="post.id")
 
+    # maintained by microblog.counters
+    like_count: int = Field(
+        default=0, nullable=False, sa_column_kwargs={"server_default": "0"}
+    )
+    reply_count: int = Field(
+        default=0, nullable=False, sa_column_kwargs={"server_default": "0"}
+    )
+
     # It populates a `.posts` attribute to the `User` model.
     user: Optional["User"] = Relationship(back_populates="posts")
 
@@ -49,6 +74,8 @@ class PostResponse(BaseModel):
     date: datetime
     user_id: int
     parent_id: Optional[int]
+    like_count: int = 0
+    reply_count: int = 0
 
     model_config = {
         "from_attributes": True
@@ -63,6 +90,13 @@ class PostResponseWithReplies(PostResponse):
     }
 
 
+class ThreadResponse(PostResponse):
+    """Serializer for a post and its nested replies"""
+
+    replies: list["ThreadResponse"] = []
+    has_more_replies: bool = False
+
+
 class PostRequest(BaseModel):
     """Serializer for Post request payload"""
 
@@ -83,6 +117,8 @@ class TimelineResponse(BaseModel):
     date: datetime
     user_id: int
     parent_id: Optional[int]
+    like_count: int = 0
+    reply_count: int = 0
 
     model_config = {
         "from_attributes": True
@@ -0,0 +1,38 @@
+"""Full-text index of posts, queried by microblog/search.py
+
+Its shape depends on the database, so it is not a model but a table
+created and dropped with `post` by DDL events:
+
+- postgres: `post_id` and a `tsvector` document with a GIN index;
+- sqlite: an FTS5 virtual table whose rowid is the post id.
+"""
+from sqlalchemy import DDL, column, event, table
+
+from microblog.models.post import Post
+
+POST_SEARCH = "post_search"
+
+pg_index = table(POST_SEARCH, column("post_id"), column("document"))
+fts_index = table(POST_SEARCH, column("rowid"), column("text"))
+
+for _ddl, _dialect in [
+    (
+        f"CREATE TABLE {POST_SEARCH} ("
+        "post_id INTEGER PRIMARY KEY REFERENCES post (id) ON DELETE CASCADE, "
+        "document TSVECTOR NOT NULL)",
+        "postgresql",
+    ),
+    (
+        f"CREATE INDEX ix_{POST_SEARCH}_document "
+        f"ON {POST_SEARCH} USING gin (document)",
+        "postgresql",
+    ),
+    (f"CREATE VIRTUAL TABLE {POST_SEARCH} USING fts5(text)", "sqlite"),
+]:
+    event.listen(
+        Post.__table__, "after_create", DDL(_ddl).execute_if(dialect=_dialect)
+    )
+
+event.listen(
+    Post.__table__, "before_drop", DDL(f"DROP TABLE IF EXISTS {POST_SEARCH}")
+)
@@ -1,15 +1,22 @@
 from typing import Optional, TYPE_CHECKING
-from datetime import datetime, timezone
+from datetime import datetime
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
 from pydantic import BaseModel
 
+from microblog.models.utils import utcnow
+
 if TYPE_CHECKING:
     from microblog.models.user import User
 
 class Social(SQLModel, table=True):
     """Modelo que representa o relacionamento de seguir entre usuários"""
     
+    __table_args__ = (
+        Index("uq_social_from_to", "from", "to", unique=True),
+        Index("ix_social_to_from", "to", "from"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     from_user_id: int = Field(
         sa_column=Column(Integer, ForeignKey("user.id"), name="from")
@@ -18,7 +25,7 @@ class Social(SQLModel, table=True):
         sa_column=Column(Integer, ForeignKey("user.id"), name="to")
     )
     date: datetime = Field(
-        default_factory=lambda: datetime.now(timezone.utc),
+        default_factory=utcnow,
         sa_column=Column(DateTime, name="date")
     )
     
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Index
+
+
+class PostTag(SQLModel, table=True):
+    """A #hashtag of a post, filled by microblog.tags"""
+
+    __tablename__ = "post_tag"
+    __table_args__ = (
+        Index("ix_post_tag_tag_date", "tag", "post_date", "post_id"),
+    )
+
+    post_id: int = Field(foreign_key="post.id", primary_key=True)
+    # lowercase, without the leading #
+    tag: str = Field(primary_key=True, max_length=64)
+    # same denormalization as TimelineEntry.post_date
+    post_date: datetime = Field(nullable=False)
+
+
+class PostMention(SQLModel, table=True):
+    """An @mention of a user in a post, filled by microblog.tags"""
+
+    __tablename__ = "post_mention"
+    __table_args__ = (
+        Index(
+            "ix_post_mention_user_date", "user_id", "post_date", "post_id"
+        ),
+    )
+
+    post_id: int = Field(foreign_key="post.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    post_date: datetime = Field(nullable=False)
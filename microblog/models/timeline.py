@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Index
+
+
+class TimelineEntry(SQLModel, table=True):
+    """Represents a post materialized in a user's home timeline"""
+
+    __tablename__ = "timeline_entry"
+    __table_args__ = (
+        Index(
+            "ix_timeline_entry_user_date", "user_id", "post_date", "post_id"
+        ),
+    )
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    post_id: int = Field(foreign_key="post.id", primary_key=True)
+    author_id: int = Field(foreign_key="user.id", nullable=False)
+    # copied from post.date so a page is a single range scan on the index
+    post_date: datetime = Field(nullable=False)
@@ -23,6 +23,14 @@ class User(SQLModel, table=True):
     bio: Optional[str] = Field(default=None)
     password: HashedPassword
 
+    # maintained by microblog.counters
+    follower_count: int = Field(
+        default=0, nullable=False, sa_column_kwargs={"server_default": "0"}
+    )
+    following_count: int = Field(
+        default=0, nullable=False, sa_column_kwargs={"server_default": "0"}
+    )
+
     posts: List["Post"] = Relationship(back_populates="user")
     
     # Relacionamentos para seguir usuários
@@ -51,6 +59,8 @@ class UserResponse(BaseModel):
     email: str
     avatar: Optional[str] = None
     bio: Optional[str] = None
+    follower_count: int = 0
+    following_count: int = 0
 
     model_config = {
         "from_attributes": True
@@ -0,0 +1,6 @@
+from datetime import datetime, timezone
+
+
+def utcnow() -> datetime:
+    """Current UTC time without tzinfo, as stored in the `timestamp` columns"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
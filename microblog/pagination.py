@@ -0,0 +1,168 @@
+"""Keyset (cursor) pagination"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Generic, List, Optional, Sequence, TypeVar
+
+from fastapi import Depends, HTTPException, Query, status
+from pydantic import BaseModel
+from sqlalchemy import tuple_
+from sqlalchemy.sql import Select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from microblog.config import config
+
+T = TypeVar("T")
+
+DEFAULT_LIMIT = config.pagination.default_limit
+MAX_LIMIT = config.pagination.max_limit
+
+
+class Page(BaseModel, Generic[T]):
+    """Serializer for a page of results
+
+    `next_cursor` goes in `before` to fetch older items,
+    `prev_cursor` goes in `after` to fetch newer items.
+    """
+
+    items: List[T]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+class PageParams(BaseModel):
+    """Pagination query parameters"""
+
+    limit: int = DEFAULT_LIMIT
+    before: Optional[str] = None
+    after: Optional[str] = None
+
+    @property
+    def ascending(self) -> bool:
+        """Walking towards newer items, the page is reversed at the end"""
+        return self.after is not None and self.before is None
+
+
+def get_pagination(
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> PageParams:
+    return PageParams(limit=limit, before=before, after=after)
+
+
+Pagination = Depends(get_pagination)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Packs the keyset values of a row into an opaque string"""
+    payload = [
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+# keyset integers are BIGINT columns
+INT_MIN, INT_MAX = -(2**63), 2**63 - 1
+
+
+def decode_value(value: Any, python_type: type) -> Any:
+    """Checks a cursor value against the python type of its column"""
+    if python_type is datetime:
+        if not isinstance(value, str):
+            raise ValueError("expected an ISO date")
+        decoded = datetime.fromisoformat(value)
+        # columns are naive UTC, comparing with an aware value fails later
+        if decoded.tzinfo is not None:
+            raise ValueError("expected a naive date")
+        return decoded
+    if python_type is int:
+        # bool is an int, floats would lose digits
+        if type(value) is not int or not INT_MIN <= value <= INT_MAX:
+            raise ValueError("expected a 64 bit integer")
+        return value
+    if not isinstance(value, python_type):
+        raise ValueError(f"expected {python_type.__name__}")
+    return value
+
+
+def decode_cursor(cursor: str, keys: Sequence[Any]) -> tuple:
+    """Unpacks a cursor using the python types of the keyset columns"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(payload, list) or len(payload) != len(keys):
+            raise ValueError("cursor does not match keyset")
+        return tuple(
+            decode_value(value, key.type.python_type)
+            for value, key in zip(payload, keys)
+        )
+    except (ValueError, TypeError, OverflowError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+def apply_keyset(
+    query: Select, params: PageParams, keys: Sequence[Any]
+) -> Select:
+    """Filters, orders and limits `query` by the keyset columns
+
+    One extra row is fetched so `build_page` knows if there is more.
+    """
+    keyset = tuple_(*keys)
+    if params.before:
+        query = query.where(keyset < decode_cursor(params.before, keys))
+    if params.after:
+        query = query.where(keyset > decode_cursor(params.after, keys))
+    if params.ascending:
+        ordering = [key.asc() for key in keys]
+    else:
+        ordering = [key.desc() for key in keys]
+    return query.order_by(*ordering).limit(params.limit + 1)
+
+
+def row_key(*names: str) -> Callable[[Any], tuple]:
+    """Builds the function that reads the keyset values from a row"""
+    return lambda row: tuple(getattr(row, name) for name in names)
+
+
+def build_page(
+    rows: Sequence[Any], params: PageParams, key: Callable[[Any], tuple]
+) -> Page:
+    """Turns the rows fetched by `apply_keyset` into a `Page`"""
+    has_more = len(rows) > params.limit
+    items = list(rows[: params.limit])
+    if params.ascending:
+        items.reverse()
+
+    next_cursor = prev_cursor = None
+    if items:
+        prev_cursor = encode_cursor(key(items[0]))
+        # walking forward there are always older items, the cursor itself
+        if has_more or params.ascending:
+            next_cursor = encode_cursor(key(items[-1]))
+    else:
+        prev_cursor = params.after
+
+    return Page(items=items, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+async def paginate(
+    session: AsyncSession,
+    query: Select,
+    params: PageParams,
+    keys: Sequence[Any],
+    key: Optional[Callable[[Any], tuple]] = None,
+) -> Page:
+    """Runs `query` returning a single page ordered by `keys` (newest first)
+
+    `key` reads the keyset values back from a row, by default the
+    attributes named after the `keys` columns.
+    """
+    rows = (await session.exec(apply_keyset(query, params, keys))).all()
+    key = key or row_key(*(column.key for column in keys))
+    return build_page(rows, params, key)
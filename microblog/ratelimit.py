@@ -0,0 +1,202 @@
+"""Per route rate limits with token buckets
+
+Each limit in `ratelimit.limits` gives a client a bucket of `burst`
+tokens refilled at `rate` tokens per `per` seconds, a request takes one
+token and is refused with 429 and `Retry-After` when the bucket is
+empty. Clients are the IP address (`by = "ip"`) or the username in the
+bearer token, the IP for anonymous requests (`by = "user"`):
+
+    @router.post("/token", dependencies=[rate_limit("token")])
+
+Route `dependencies` are solved before the endpoint's own, so a refused
+request never opens a database session nor hashes a password. The IP is
+`request.client.host`, run uvicorn with `--proxy-headers` behind a proxy.
+
+Backends (`ratelimit.backend`):
+
+- "memory": buckets in a `TTLCache` per process, an entry expires once
+  its bucket would be full again so idle clients cost nothing. With
+  several workers each one allows the full rate.
+- "redis": buckets shared by every worker (`pip install redis`), updated
+  by a script so concurrent requests never take the same token.
+"""
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+from fastapi import Depends, HTTPException, Request, status
+
+from microblog.auth import decode_token
+from microblog.cache import TTLCache
+from microblog.config import config
+from microblog.tokens import TokenError
+
+ENABLED = config.ratelimit.enabled
+
+
+@dataclass(frozen=True)
+class Limit:
+    rate: float
+    per: float
+    burst: int
+    by: str = "ip"
+
+    def __post_init__(self):
+        if self.by not in ("ip", "user"):
+            raise RuntimeError(f"Unknown rate limit key {self.by!r}")
+
+    @property
+    def refill(self) -> float:
+        """Tokens per second"""
+        return self.rate / self.per
+
+
+LIMITS: Dict[str, Limit] = {
+    name: Limit(**options)
+    for name, options in config.ratelimit.limits.items()
+}
+
+# limit name -> requests refused
+throttled: Dict[str, int] = {}
+
+
+def take_token(
+    tokens: float, elapsed: float, limit: Limit
+) -> Tuple[float, float]:
+    """(tokens left, seconds to wait) for a bucket that had `tokens`
+    `elapsed` seconds ago, the wait is 0 when a token was taken"""
+    tokens = min(limit.burst, tokens + elapsed * limit.refill)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / limit.refill
+
+
+class MemoryBackend:
+    """(tokens, timestamp) per client in a `TTLCache`"""
+
+    def __init__(self, maxsize: int, redis_url: str):
+        self.buckets = TTLCache(maxsize=maxsize, ttl=0)
+
+    async def take(self, key: str, limit: Limit) -> float:
+        now = time.monotonic()
+        tokens, stamp = self.buckets.get(key, (limit.burst, now))
+        tokens, wait = take_token(tokens, now - stamp, limit)
+        # a bucket that would be full again is the same as no bucket
+        self.buckets.set(
+            key, (tokens, now), ttl=(limit.burst - tokens) / limit.refill
+        )
+        return wait
+
+    async def clear(self):
+        self.buckets.clear()
+
+
+# KEYS[1] bucket, ARGV rate per second, burst; returns the wait in
+# milliseconds, 0 when a token was taken
+TAKE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local refill = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(bucket[1]) or burst
+local stamp = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - stamp) * refill)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / refill * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / refill * 1000) + 1)
+return wait
+"""
+
+
+class RedisBackend:
+    """Buckets shared by every worker through redis"""
+
+    prefix = "microblog:ratelimit:"
+
+    def __init__(self, maxsize: int, redis_url: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError(
+                "ratelimit.backend = 'redis' needs `pip install redis`"
+            )
+
+        self.client = redis.from_url(redis_url)
+        self.script = self.client.register_script(TAKE_SCRIPT)
+
+    async def take(self, key: str, limit: Limit) -> float:
+        wait = await self.script(
+            keys=[self.prefix + key], args=[limit.refill, limit.burst]
+        )
+        return int(wait) / 1000
+
+    async def clear(self):
+        async for name in self.client.scan_iter(match=self.prefix + "*"):
+            await self.client.delete(name)
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "redis": RedisBackend,
+}
+
+
+def get_backend(name: str, maxsize: int, redis_url: str):
+    """Instantiates the backend configured in `ratelimit.backend`"""
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise RuntimeError(f"Unknown rate limit backend {name!r}")
+    return backend(maxsize, redis_url)
+
+
+limiter = get_backend(
+    config.ratelimit.backend,
+    config.ratelimit.size,
+    config.ratelimit.redis_url,
+)
+
+
+def client_key(request: Request, limit: Limit) -> str:
+    """Who the bucket belongs to, `user:<name>` or `ip:<address>`"""
+    if limit.by == "user":
+        authorization = request.headers.get("authorization", "")
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() == "bearer" and token:
+            try:
+                return f"user:{decode_token(token)['sub']}"
+            except (TokenError, KeyError):
+                # refused later by the endpoint, counted against the IP
+                pass
+    host = request.client.host if request.client else "unknown"
+    return f"ip:{host}"
+
+
+def rate_limit(name: str):
+    """Dependency taking a token from the `name` limit's bucket"""
+    if name not in LIMITS:
+        raise RuntimeError(f"No ratelimit.limits.{name} in the settings")
+
+    async def check(request: Request):
+        if not ENABLED:
+            return
+        limit = LIMITS[name]
+        key = f"{name}:{client_key(request, limit)}"
+        wait = await limiter.take(key, limit)
+        if wait > 0:
+            throttled[name] = throttled.get(name, 0) + 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                # whole seconds, rounded up so the retry finds a token
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    return Depends(check)
@@ -0,0 +1,197 @@
+"""Shared cache of public GET responses
+
+Routes of a router using `CachedRoute` and marked with `@cached(*tags)`
+store their rendered 200 responses keyed by path and query string, and
+replay them without running the endpoint. Writes call `invalidate` with
+the tags they affect once committed:
+
+    @router.get("/")
+    @cached("posts")
+    async def list_posts(...): ...
+
+    await response_cache.invalidate("posts")
+
+Tags may name path parameters, `@cached("user:{username}")`.
+
+Backends (`cache.backend`):
+
+- "memory": a size bounded LRU with TTL per process. Other workers only
+  see an invalidation when their copy expires, keep `cache.ttl` short.
+- "redis": shared by every worker (`pip install redis`), evictions follow
+  the server's `maxmemory-policy`, allkeys-lru for an LRU.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from microblog.cache import TTLCache
+from microblog.conditional import Validators
+from microblog.config import config
+
+ENABLED = config.cache.enabled
+
+
+class MemoryBackend:
+    """Responses in a `TTLCache` plus a tag -> keys index"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.tags: Dict[str, Set[str]] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.entries.get(key)
+
+    async def set(self, key: str, value: bytes, tags: Iterable[str]):
+        self.entries.set(key, value)
+        for tag in tags:
+            keys = self.tags.setdefault(tag, set())
+            keys.add(key)
+            # forget keys that were evicted or expired meanwhile
+            if len(keys) > self.entries.maxsize:
+                keys.intersection_update(
+                    k for k in list(keys) if k in self.entries
+                )
+
+    async def invalidate(self, *tags: str):
+        for tag in tags:
+            for key in self.tags.pop(tag, ()):
+                self.entries.pop(key)
+
+    async def clear(self):
+        self.entries.clear()
+        self.tags.clear()
+
+
+class RedisBackend:
+    """Responses shared by every worker through redis"""
+
+    prefix = "microblog:cache:"
+
+    def __init__(self, maxsize: int, ttl: float):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError(
+                "cache.backend = 'redis' needs `pip install redis`"
+            )
+
+        self.client = redis.from_url(config.cache.redis_url)
+        self.ttl = int(ttl)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, tags: Iterable[str]):
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.set(self.prefix + key, value, ex=self.ttl)
+            for tag in tags:
+                pipe.sadd(f"{self.prefix}tag:{tag}", key)
+                pipe.expire(f"{self.prefix}tag:{tag}", self.ttl)
+            await pipe.execute()
+
+    async def invalidate(self, *tags: str):
+        for tag in tags:
+            name = f"{self.prefix}tag:{tag}"
+            keys = await self.client.smembers(name)
+            await self.client.delete(
+                name, *(self.prefix + k.decode() for k in keys)
+            )
+
+    async def clear(self):
+        async for name in self.client.scan_iter(match=self.prefix + "*"):
+            await self.client.delete(name)
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "redis": RedisBackend,
+}
+
+
+def get_backend(name: str, maxsize: int, ttl: float):
+    """Instantiates the backend configured in `cache.backend`"""
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise RuntimeError(f"Unknown cache backend {name!r}")
+    return backend(maxsize, ttl)
+
+
+response_cache = get_backend(
+    config.cache.backend, config.cache.size, config.cache.ttl
+)
+
+
+def cached(*tags: str):
+    """Marks a GET endpoint as cacheable under `tags`"""
+
+    def decorate(endpoint):
+        endpoint.cache_tags = tags
+        return endpoint
+
+    return decorate
+
+
+def cache_key(request: Request) -> str:
+    query = "&".join(sorted(request.url.query.split("&")))
+    return f"{request.url.path}?{query}"
+
+
+def pack(response: Response) -> bytes:
+    """Response headers and body in one HTTP like blob"""
+    head = b"\r\n".join(
+        name + b": " + value for name, value in response.raw_headers
+    )
+    return head + b"\r\n\r\n" + response.body
+
+
+def unpack(value: bytes) -> Tuple[List[Tuple[bytes, bytes]], bytes]:
+    head, body = value.split(b"\r\n\r\n", 1)
+    headers = [
+        tuple(line.split(b": ", 1)) for line in head.split(b"\r\n") if line
+    ]
+    return headers, body
+
+
+def replay(request: Request, value: bytes) -> Response:
+    headers, body = unpack(value)
+    etag = dict(headers).get(b"etag")
+    if etag is not None:
+        validators = Validators(etag.decode("latin-1"))
+        if validators.matches(request):
+            return validators.not_modified()
+    response = Response(content=body)
+    response.raw_headers = headers + [(b"x-cache", b"HIT")]
+    return response
+
+
+class CachedRoute(APIRoute):
+    """Serves `@cached` endpoints from `response_cache`"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        tags = getattr(self.endpoint, "cache_tags", None)
+        if tags is None:
+            return handler
+
+        async def cached_handler(request: Request) -> Response:
+            if not ENABLED or request.method != "GET":
+                return await handler(request)
+            key = cache_key(request)
+            value = await response_cache.get(key)
+            if value is not None:
+                return replay(request, value)
+
+            response = await handler(request)
+            # streamed bodies are never held in memory to be stored
+            if response.status_code == 200 and hasattr(response, "body"):
+                await response_cache.set(
+                    key,
+                    pack(response),
+                    [tag.format(**request.path_params) for tag in tags],
+                )
+            response.headers["X-Cache"] = "MISS"
+            return response
+
+        return cached_handler
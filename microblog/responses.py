@@ -0,0 +1,129 @@
+"""Column projections and fast JSON responses for list endpoints
+
+List endpoints select only the columns of their response model (or of
+the `fields=` sparse fieldset) and get lightweight rows back instead of
+identity-mapped ORM objects.
+
+By default FastAPI still validates those rows against `response_model`
+and encodes them with the stdlib json module. With `responses.fast_json`
+the rows are encoded straight to bytes with orjson (`pip install
+orjson`), or pydantic-core's `to_json` without it. The JSON is the same
+either way and the OpenAPI schema still comes from `response_model`.
+A sparse fieldset is always encoded this way, it would not validate
+against the full response model.
+"""
+from typing import Any, Callable, List, Optional, Sequence, Type
+
+from fastapi import Depends, HTTPException, Query, status
+from fastapi.responses import Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+from sqlalchemy import Select, select
+
+from microblog.config import config
+from microblog.models.post import PostResponse
+from microblog.pagination import Page
+
+FAST_JSON = config.responses.fast_json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+POST_FIELDS = list(PostResponse.model_fields)
+# keyset columns of the post listings, selected even when not requested
+POST_KEYS = ("date", "id")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return to_json(content)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def field_set(model: Type[BaseModel]) -> Callable[..., List[str]]:
+    """Dependency reading `?fields=a,b` restricted to the fields of `model`"""
+    allowed = list(model.model_fields)
+
+    def get_fields(
+        fields: Optional[str] = Query(
+            None,
+            description=f"Comma separated subset of {', '.join(allowed)}",
+        ),
+    ) -> List[str]:
+        if not fields:
+            return allowed
+        names = list(dict.fromkeys(
+            name.strip() for name in fields.split(",") if name.strip()
+        ))
+        if not names:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="fields must not be empty",
+            )
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(unknown)}",
+            )
+        return names
+
+    return get_fields
+
+
+PostFields = Depends(field_set(PostResponse))
+
+
+def projection(
+    table: Type, fields: Sequence[str], keys: Sequence[str] = ()
+) -> Select:
+    """Selects the columns of `table` for `fields` and any missing `keys`
+
+    Encoding zips rows with `fields`, so the trailing key columns are
+    used for cursors and merging but never make it into the response.
+    A plain SQLAlchemy select, sqlmodel's would turn a single column
+    into scalars instead of rows.
+    """
+    names = list(fields) + [key for key in keys if key not in fields]
+    return select(*(getattr(table, name) for name in names))
+
+
+def encode_rows(rows: Sequence[Any], fields: Sequence[str]) -> List[dict]:
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def _fast(fields: Sequence[str], model: Type[BaseModel]) -> bool:
+    return FAST_JSON or list(fields) != list(model.model_fields)
+
+
+def page_response(
+    page: Page,
+    fields: Sequence[str] = POST_FIELDS,
+    model: Type[BaseModel] = PostResponse,
+):
+    """Encodes a page of rows, or hands it to FastAPI to validate"""
+    if not _fast(fields, model):
+        return page
+    return FastJSONResponse({
+        "items": encode_rows(page.items, fields),
+        "next_cursor": page.next_cursor,
+        "prev_cursor": page.prev_cursor,
+    })
+
+
+def list_response(
+    rows: Sequence[Any], fields: Sequence[str], model: Type[BaseModel]
+):
+    """Encodes a list of rows, or hands it to FastAPI to validate"""
+    if not _fast(fields, model):
+        return rows
+    return FastJSONResponse(encode_rows(rows, fields))
@@ -5,9 +5,13 @@ from fastapi import APIRouter
 from .user  import router as user_router
 from .post import router as post_router
 from .auth import router as auth_router
+from .metrics import router as metrics_router
+from .health import router as health_router
 
 main_router = APIRouter()
 
 main_router.include_router(auth_router, tags=["auth"])
 main_router.include_router(user_router, prefix="/user", tags=["user"])
 main_router.include_router(post_router, prefix="/post", tags=["post"])
+main_router.include_router(metrics_router, tags=["metrics"])
+main_router.include_router(health_router, tags=["health"])
@@ -1,7 +1,9 @@
 from datetime import timedelta
+from functools import partial
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from microblog.auth import (
     RefreshToken,
@@ -10,22 +12,31 @@ from microblog.auth import (
     authenticate_user,
     create_access_token,
     create_refresh_token,
-    get_user,
+    load_user,
     validate_token,
 )
-from microblog.config import settings
+from microblog.config import config
+from microblog.dependencies import AsyncActiveSession
+from microblog.ratelimit import rate_limit
 
-ACCESS_TOKEN_EXPIRE_MINUTES = settings.security.access_token_expire_minutes
-REFRESH_TOKEN_EXPIRE_MINUTES = settings.security.refresh_token_expire_minutes
+ACCESS_TOKEN_EXPIRE_MINUTES = config.security.access_token_expire_minutes
+REFRESH_TOKEN_EXPIRE_MINUTES = config.security.refresh_token_expire_minutes
 
 router = APIRouter()
 
 
-@router.post("/token", response_model=Token)
+@router.post(
+    "/token", response_model=Token, dependencies=[rate_limit("token")]
+)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
+    session: AsyncSession = AsyncActiveSession,
 ):
-    user = authenticate_user(get_user, form_data.username, form_data.password)
+    user = await authenticate_user(
+        partial(load_user, session=session),
+        form_data.username,
+        form_data.password,
+    )
     if not user or not isinstance(user, User):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -52,8 +63,12 @@ async def login_for_access_token(
 
 
 @router.post("/refresh_token", response_model=Token)
-async def refresh_token(form_data: RefreshToken):
-    user = await validate_token(token=form_data.refresh_token)
+async def refresh_token(
+    form_data: RefreshToken, session: AsyncSession = AsyncActiveSession
+):
+    user = await validate_token(
+        token=form_data.refresh_token, session=session
+    )
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -0,0 +1,65 @@
+import asyncio
+
+from fastapi import APIRouter, Response, status
+from sqlalchemy import text
+
+from microblog.config import config
+from microblog.db import async_engine, pool_stats
+from microblog.metrics import ENGINES, POOL_WAIT
+
+PING_TIMEOUT = config.db.ping_timeout
+
+router = APIRouter()
+
+
+def _pools() -> dict:
+    pools = {}
+    for name, engine in ENGINES.items():
+        stats = pool_stats(engine)
+        stats["wait_seconds"] = POOL_WAIT.snapshot(name)
+        pools[name] = stats
+    return pools
+
+
+def _saturated(stats: dict) -> bool:
+    if "size" not in stats:
+        return False
+    return stats["checked_out"] >= stats["size"] + stats["max_overflow"]
+
+
+@router.get("/health/pool")
+async def pool():
+    """Connection pool statistics of both engines"""
+    return _pools()
+
+
+@router.get("/health/ready")
+async def ready(response: Response):
+    """Readiness probe, 503 when the database does not answer
+
+    A saturated pool is reported but still ready, requests queue for
+    up to db.pool_timeout.
+    """
+
+    async def ping():
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    try:
+        await asyncio.wait_for(ping(), PING_TIMEOUT)
+        database = "ok"
+    except asyncio.TimeoutError:
+        database = f"no answer in {PING_TIMEOUT}s"
+    except Exception as error:
+        # the message may carry hosts or credentials
+        database = type(error).__name__
+
+    pools = _pools()
+    if database != "ok":
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        state = "unavailable"
+    elif any(_saturated(stats) for stats in pools.values()):
+        state = "saturated"
+    else:
+        state = "ready"
+    return {"status": state, "database": database, "pools": pools}
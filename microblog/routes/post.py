@@ -1,64 +1,217 @@
-from typing import List
-from fastapi import APIRouter, HTTPException, status, Depends
-from sqlmodel import Session, select
-from sqlalchemy import Select
+from typing import List, Optional
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import Select, func
+from sqlalchemy.orm import aliased, selectinload
 
+from microblog import live
 from microblog.auth import AuthenticatedUser, get_current_user
-from microblog.db import ActiveSession
+from microblog.conditional import Validators, make_etag
+from microblog.db import insert_or_ignore
+from microblog.dependencies import AsyncActiveSession
 from microblog.models.post import (
     Post,
     PostRequest,
     PostResponse,
     PostResponseWithReplies,
+    ThreadResponse,
 )
 from microblog.models.user import User
 from microblog.models.like import Like
+from microblog.models.tag import PostTag
+from microblog.models.utils import utcnow
+from microblog.config import config
+from microblog.counters import increment
+from microblog.pagination import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    Page,
+    PageParams,
+    Pagination,
+    paginate,
+)
+from microblog.ratelimit import rate_limit
+from microblog.response_cache import CachedRoute, cached, response_cache
+from microblog.responses import (
+    POST_KEYS,
+    PostFields,
+    list_response,
+    page_response,
+    projection,
+)
+from microblog.search import index_post, search_query
+from microblog.tags import index_tags, normalize_tag
+from microblog.thread import load_thread
+from microblog.timeline import POST_KEY, fan_out_post
 
-router = APIRouter()
+THREAD_DEPTH = config.thread.default_depth
+THREAD_MAX_DEPTH = config.thread.max_depth
 
+router = APIRouter(route_class=CachedRoute)
 
-@router.get("/", response_model=List[PostResponse])
-async def list_posts(*, session: Session = ActiveSession):
+
+@router.get("/", response_model=Page[PostResponse])
+@cached("posts")
+async def list_posts(
+    *,
+    session: AsyncSession = AsyncActiveSession,
+    page: PageParams = Pagination,
+    fields: List[str] = PostFields,
+):
     """List all posts without replies"""
-    query: Select[Post] = select(Post).where(Post.parent == None)
-    posts = session.exec(query).all()
-    return posts
+    query: Select = projection(Post, fields, POST_KEYS).where(
+        Post.parent == None
+    )
+    page = await paginate(session, query, page, keys=(Post.date, Post.id))
+    return page_response(page, fields)
+
+
+@router.get("/search", response_model=Page[PostResponse])
+@cached("posts")
+async def search_posts(
+    *,
+    session: AsyncSession = AsyncActiveSession,
+    q: str = Query(..., min_length=1, max_length=200),
+    page: PageParams = Pagination,
+    fields: List[str] = PostFields,
+):
+    """Full-text search over posts, most relevant first"""
+    query, rank = search_query(session.bind.dialect.name, q, fields)
+    page = await paginate(session, query, page, keys=(rank, Post.id))
+    return page_response(page, fields)
+
+
+@router.get("/tag/{tag}/", response_model=Page[PostResponse])
+@cached("posts")
+async def get_posts_by_tag(
+    *,
+    session: AsyncSession = AsyncActiveSession,
+    tag: str,
+    page: PageParams = Pagination,
+    fields: List[str] = PostFields,
+):
+    """Posts with a #tag, newest first"""
+    query: Select = (
+        projection(Post, fields, POST_KEYS)
+        .join(PostTag, PostTag.post_id == Post.id)
+        .where(PostTag.tag == normalize_tag(tag))
+    )
+    page = await paginate(
+        session,
+        query,
+        page,
+        keys=(PostTag.post_date, PostTag.post_id),
+        key=POST_KEY,
+    )
+    return page_response(page, fields)
+
+
+async def post_validators(
+    session: AsyncSession, post_id: int
+) -> Optional[Validators]:
+    """Validators of a post and its replies from one aggregate query"""
+    reply = aliased(Post)
+    query = (
+        select(
+            Post.date,
+            Post.like_count,
+            Post.reply_count,
+            func.count(reply.id),
+            func.max(reply.id),
+            func.max(reply.date),
+            func.coalesce(func.sum(reply.like_count), 0),
+            func.coalesce(func.sum(reply.reply_count), 0),
+        )
+        .outerjoin(reply, reply.parent_id == Post.id)
+        .where(Post.id == post_id)
+        .group_by(Post.id)
+    )
+    version = (await session.exec(query)).first()
+    if version is None:
+        return None
+    return Validators(make_etag(post_id, *version))
 
 
 @router.get("/{post_id}/", response_model=PostResponseWithReplies)
 async def get_post_by_post_id(
     *,
-    session: Session = ActiveSession,
+    session: AsyncSession = AsyncActiveSession,
     post_id: int,
+    request: Request,
+    response: Response,
 ):
     """Get post by post_id"""
-    query: Select[Post] = select(Post).where(Post.id == post_id)
-    post = session.exec(query).first()
+    validators = await post_validators(session, post_id)
+    if validators is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    if validators.matches(request):
+        return validators.not_modified()
+
+    query: Select[Post] = (
+        select(Post)
+        .where(Post.id == post_id)
+        .options(selectinload(Post.replies))
+    )
+    post = (await session.exec(query)).first()
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    return post
+    return validators.apply(post, response)
+
+
+@router.get("/{post_id}/thread/", response_model=ThreadResponse)
+async def get_thread(
+    *,
+    session: AsyncSession = AsyncActiveSession,
+    post_id: int,
+    depth: int = Query(THREAD_DEPTH, ge=0, le=THREAD_MAX_DEPTH),
+    page_size: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+):
+    """Get a post with its replies nested up to `depth` levels"""
+    thread = await load_thread(session, post_id, depth, page_size)
+    if not thread:
+        raise HTTPException(status_code=404, detail="Post not found")
+    return thread
 
 
-@router.get("/user/{username}/", response_model=List[PostResponse])
+@router.get("/user/{username}/", response_model=Page[PostResponse])
+@cached("posts")
 async def get_posts_by_username(
     *,
-    session: Session = ActiveSession,
+    session: AsyncSession = AsyncActiveSession,
     username: str,
     include_replies: bool = False,
+    page: PageParams = Pagination,
+    fields: List[str] = PostFields,
 ):
     """Get posts by username"""
     filters = [User.username == username]
     if not include_replies:
         filters.append(Post.parent == None)
-    query: Select[Post] = select(Post).join(User).where(*filters)
-    posts = session.exec(query).all()
-    return posts
+    query: Select = (
+        projection(Post, fields, POST_KEYS).join(User).where(*filters)
+    )
+    page = await paginate(session, query, page, keys=(Post.date, Post.id))
+    return page_response(page, fields)
 
 
-@router.post("/", response_model=PostResponse, status_code=201)
+@router.post(
+    "/",
+    response_model=PostResponse,
+    status_code=201,
+    dependencies=[rate_limit("create_post")],
+)
 async def create_post(
     *,
-    session: Session = ActiveSession,
+    session: AsyncSession = AsyncActiveSession,
     user: User = AuthenticatedUser,
     post: PostRequest,
 ):
@@ -70,73 +223,84 @@ async def create_post(
     })
     
     session.add(db_post)
-    session.commit()
-    session.refresh(db_post)
+    await session.flush()
+    await index_post(session, db_post)
+    await index_tags(session, db_post)
+    if db_post.parent_id:
+        await session.exec(
+            increment(Post.reply_count, Post.id == db_post.parent_id)
+        )
+    await fan_out_post(session, db_post)
+    await session.commit()
+    await response_cache.invalidate("posts")
+    await session.refresh(db_post)
+    await live.publish(db_post)
     return db_post
 
 
-@router.post("/{post_id}/like/", status_code=status.HTTP_201_CREATED)
-def like_post(
+@router.post(
+    "/{post_id}/like/",
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[rate_limit("like_post")],
+)
+async def like_post(
     post_id: int,
     current_user: User = Depends(get_current_user),
-    session: Session = ActiveSession
+    session: AsyncSession = AsyncActiveSession
 ):
     """Like a post"""
     # Verifica se o post existe
-    post = session.get(Post, post_id)
+    post = await session.get(Post, post_id)
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Post not found"
         )
     
-    # Verifica se o usuário já curtiu o post
-    existing_like = session.exec(
-        select(Like).where(
-            Like.user_id == current_user.id,
-            Like.post_id == post_id
-        )
-    ).first()
-    
-    if existing_like:
+    # Cria o like, o índice único barra curtidas repetidas
+    like = insert_or_ignore(session, Like.__table__, {
+        "user": current_user.id,
+        "post": post_id,
+        "date": utcnow(),
+    })
+    result = await session.exec(like)
+    if result.rowcount == 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You already liked this post"
         )
-    
-    # Cria o like
-    like = Like(user_id=current_user.id, post_id=post_id)
-    session.add(like)
-    session.commit()
-    session.refresh(like)
+    await session.exec(increment(Post.like_count, Post.id == post_id))
+    await session.commit()
+    await response_cache.invalidate("posts")
     
     return {"message": "Post liked successfully"}
 
 
-@router.get("/likes/{username}/", response_model=List[Post])
-def get_user_liked_posts(
+@router.get("/likes/{username}/", response_model=List[PostResponse])
+async def get_user_liked_posts(
     username: str,
     current_user: User = Depends(get_current_user),
-    session: Session = ActiveSession
+    session: AsyncSession = AsyncActiveSession,
+    fields: List[str] = PostFields,
 ):
     """Get all posts liked by a user"""
     # Busca o usuário
-    user = session.exec(
-        select(User).where(User.username == username)
-    ).first()
+    user_id = (await session.exec(
+        select(User.id).where(User.username == username)
+    )).first()
     
-    if not user:
+    if not user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
     # Busca todos os posts curtidos pelo usuário
-    liked_posts = session.exec(
-        select(Post)
+    liked_posts = (await session.exec(
+        projection(Post, fields)
         .join(Like)
-        .where(Like.user_id == user.id)
+        .where(Like.user_id == user_id)
         .order_by(Post.date.desc())
-    ).all()
+    )).all()
     
-    return liked_posts
\ No newline at end of file
+    return list_response(liked_posts, fields, PostResponse)
\ No newline at end of file
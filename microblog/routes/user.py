@@ -1,50 +1,165 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from microblog.db import ActiveSession
+from microblog import export, live
+from microblog.conditional import Validators, make_etag
+from microblog.counters import count_follow
+from microblog.db import async_engine, insert_or_ignore
+from microblog.dependencies import AsyncActiveSession
 from microblog.models.user import User, UserRequest, UserResponse
 from microblog.models.social import Social
-from microblog.models.post import Post, TimelineResponse
-from microblog.security import HashedPassword
-from microblog.auth import get_current_user
+from microblog.models.post import Post, PostResponse, TimelineResponse
+from microblog.models.tag import PostMention
+from microblog.models.utils import utcnow
+from microblog.security import get_password_hash_async
+from microblog.auth import (
+    decode_token,
+    get_current_user,
+    load_user,
+    oauth2_scheme,
+    user_cache,
+)
+from microblog.tokens import TokenError
+from microblog.pagination import Page, PageParams, Pagination, paginate
+from microblog.response_cache import CachedRoute, cached, response_cache
+from microblog.responses import (
+    POST_KEYS,
+    PostFields,
+    field_set,
+    list_response,
+    page_response,
+    projection,
+)
+from microblog.timeline import (
+    POST_KEY,
+    backfill_follow,
+    read_timeline,
+    timeline_version,
+)
+
+router = APIRouter(route_class=CachedRoute)
+
+UserFields = Depends(field_set(UserResponse))
+USER_FIELDS = list(UserResponse.model_fields)
+
+
+async def _user_id(session: AsyncSession, username: str) -> int:
+    user_id = (await session.exec(
+        select(User.id).where(User.username == username)
+    )).first()
+    if not user_id:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_id
 
-router = APIRouter()
 
 @router.get("/", response_model=List[UserResponse])
-async def list_users(*, session: Session = ActiveSession):
+@cached("users")
+async def list_users(
+    *,
+    session: AsyncSession = AsyncActiveSession,
+    fields: List[str] = UserFields,
+):
     """List all users"""
-    users = session.exec(select(User)).all()
-    return users
+    users = (await session.exec(projection(User, fields))).all()
+    return list_response(users, fields, UserResponse)
 
 @router.get("/{username}/", response_model=UserResponse)
+@cached("users")
 async def get_user_by_username(
-        *, session: Session = ActiveSession, username: str
+    *,
+    session: AsyncSession = AsyncActiveSession,
+    username: str,
+    request: Request,
+    response: Response,
 ):
     """Get user by username"""
-    query = select(User).where(User.username == username)
-    user = session.exec(query).first()
+    query = projection(User, USER_FIELDS).where(User.username == username)
+    user = (await session.exec(query)).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    return UserResponse(
-        id=user.id,
-        username=user.username,
-        email=user.email,
-        avatar=user.avatar,
-        bio=user.bio
+
+    # the row is tiny, it is its own version
+    validators = Validators(make_etag(*user))
+    if validators.matches(request):
+        return validators.not_modified()
+    return validators.apply(user, response)
+
+@router.get("/{username}/mentions/", response_model=Page[PostResponse])
+@cached("posts")
+async def get_user_mentions(
+    *,
+    session: AsyncSession = AsyncActiveSession,
+    username: str,
+    page: PageParams = Pagination,
+    fields: List[str] = PostFields,
+):
+    """Posts mentioning @username, newest first"""
+    user_id = await _user_id(session, username)
+    query = (
+        projection(Post, fields, POST_KEYS)
+        .join(PostMention, PostMention.post_id == Post.id)
+        .where(PostMention.user_id == user_id)
+    )
+    page = await paginate(
+        session,
+        query,
+        page,
+        keys=(PostMention.post_date, PostMention.post_id),
+        key=POST_KEY,
+    )
+    return page_response(page, fields)
+
+@router.get("/{username}/export/posts")
+async def export_posts(
+    *,
+    session: AsyncSession = AsyncActiveSession,
+    username: str,
+    gzip: bool = Query(False, description="Send a .ndjson.gz file"),
+):
+    """Streams every post and reply of a user as NDJSON, oldest first"""
+    query, fields = export.posts_query(await _user_id(session, username))
+    return export.ndjson_response(
+        query, fields, f"{username}-posts", gzip
+    )
+
+@router.get("/{username}/export/likes")
+async def export_likes(
+    *,
+    session: AsyncSession = AsyncActiveSession,
+    username: str,
+    current_user: User = Depends(get_current_user),
+    gzip: bool = Query(False, description="Send a .ndjson.gz file"),
+):
+    """Streams every post liked by a user as NDJSON, oldest like first"""
+    query, fields = export.likes_query(await _user_id(session, username))
+    return export.ndjson_response(
+        query, fields, f"{username}-likes", gzip
     )
 
 @router.post("/", response_model=UserResponse, status_code=201)
-async def create_user(*, session: Session = ActiveSession, user: UserRequest):
+async def create_user(
+    *, session: AsyncSession = AsyncActiveSession, user: UserRequest
+):
     """Create new user"""
     # Verifica se o usuário já existe
-    existing_user = session.exec(
+    existing_user = (await session.exec(
         select(User).where(
             (User.email == user.email) | (User.username == user.username)
         )
-    ).first()
+    )).first()
     
     if existing_user:
         raise HTTPException(
@@ -56,26 +171,27 @@ async def create_user(*, session: Session = ActiveSession, user: UserRequest):
     db_user = User.model_validate({
         "email": user.email,
         "username": user.username,
-        "password": HashedPassword(user.password),
+        "password": await get_password_hash_async(user.password),
         "avatar": user.avatar,
         "bio": user.bio
     })
     
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await response_cache.invalidate("users")
+    await session.refresh(db_user)
     return db_user
 
 @router.post("/follow/{user_id}", status_code=201)
 async def follow_user(
     *,
-    session: Session = ActiveSession,
+    session: AsyncSession = AsyncActiveSession,
     user_id: int,
     current_user: User = Depends(get_current_user)
 ):
     """Seguir um usuário"""
     # Verifica se o usuário a ser seguido existe
-    user_to_follow = session.get(User, user_id)
+    user_to_follow = await session.get(User, user_id)
     if not user_to_follow:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -83,49 +199,97 @@ async def follow_user(
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
     
-    # Verifica se já não está seguindo
-    existing_follow = session.exec(
-        select(Social).where(
-            (Social.from_user_id == current_user.id) & 
-            (Social.to_user_id == user_id)
-        )
-    ).first()
-    
-    if existing_follow:
+    # Cria o relacionamento de seguir, o índice único barra duplicados
+    follow = insert_or_ignore(session, Social.__table__, {
+        "from": current_user.id,
+        "to": user_id,
+        "date": utcnow(),
+    })
+    result = await session.exec(follow)
+    if result.rowcount == 0:
         raise HTTPException(status_code=400, detail="Already following this user")
     
-    # Cria o relacionamento de seguir
-    follow = Social(from_user_id=current_user.id, to_user_id=user_id)
-    session.add(follow)
-    session.commit()
+    await session.exec(count_follow(current_user.id, user_id))
+    await backfill_follow(session, current_user.id, user_id)
+    await session.commit()
+    # the counters were updated behind the ORM, its events never fired
+    user_cache.pop(current_user.username)
+    user_cache.pop(user_to_follow.username)
+    # follower counts are part of the user listings
+    await response_cache.invalidate("users")
     
     return {"message": f"Now following user {user_to_follow.username}"}
 
-@router.get("/timeline", response_model=List[TimelineResponse])
+@router.get("/timeline", response_model=Page[TimelineResponse])
 async def get_timeline(
     *,
-    session: Session = ActiveSession,
-    current_user: User = Depends(get_current_user)
+    session: AsyncSession = AsyncActiveSession,
+    current_user: User = Depends(get_current_user),
+    page: PageParams = Pagination,
+    fields: List[str] = PostFields,
+    request: Request,
+    response: Response,
 ):
     """Lista todos os posts dos usuários que o usuário atual segue"""
-    # Busca os IDs dos usuários que o usuário atual segue
-    following_ids = session.exec(
-        select(Social.to_user_id)
-        .where(Social.from_user_id == current_user.id)
-    ).all()
-    
-    if not following_ids:
-        return []
-    
+    # a 304 skips reading the posts, not just encoding them
+    version = await timeline_version(session, current_user, page)
+    validators = Validators(make_etag(fields, version), private=True)
+    if validators.matches(request):
+        return validators.not_modified()
+    page = await read_timeline(session, current_user, page, fields)
+    return validators.apply(
+        page_response(page, fields, TimelineResponse), response
+    )
+
+
+async def _following(session: AsyncSession, user_id: int) -> List[int]:
+    query = select(Social.to_user_id).where(Social.from_user_id == user_id)
+    return list((await session.exec(query)).all())
+
+
+async def _token_user(session: AsyncSession, token: str) -> Optional[User]:
     try:
-        posts = session.exec(
-            select(Post)
-            .where(Post.user_id.in_(following_ids))
-            .order_by(Post.date.desc())
-        ).all()
-        
-        # Convertendo os posts para TimelineResponse
-        return [TimelineResponse.model_validate(post) for post in posts]
-    except Exception as e:
-        print(f"Erro ao buscar posts: {e}")
-        return []
+        return await load_user(decode_token(token).get("sub"), session)
+    except TokenError:
+        return None
+
+@router.get("/timeline/stream")
+async def stream_timeline(token: str = Depends(oauth2_scheme)):
+    """Pushes the new posts of followed users as server-sent events"""
+    # not a dependency, the session is only needed before streaming
+    async with AsyncSession(async_engine) as session:
+        user = await _token_user(session, token)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        following = await _following(session, user.id)
+    return StreamingResponse(
+        live.sse_stream(following),
+        media_type="text/event-stream",
+        # no buffering by nginx and alike
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/timeline/ws")
+async def timeline_websocket(
+    websocket: WebSocket, token: Optional[str] = None
+):
+    """Pushes the new posts of followed users as JSON messages
+
+    Browsers cannot set headers on a WebSocket, the access token may be
+    sent as `?token=` instead of an Authorization header.
+    """
+    authorization = websocket.headers.get("authorization", "")
+    token = token or authorization.partition(" ")[2]
+    # not a dependency, that session would stay open with the socket
+    async with AsyncSession(async_engine) as session:
+        user = await _token_user(session, token)
+        if user is None:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        following = await _following(session, user.id)
+
+    await live.websocket_stream(websocket, following)
@@ -0,0 +1,103 @@
+"""Full-text search over posts
+
+- postgres: `websearch_to_tsquery` against the GIN indexed `tsvector`,
+  ranked with `ts_rank`;
+- sqlite: FTS5 where every word of the query must match, ranked with
+  `bm25`.
+
+`create_post` indexes new posts, `microblog search-reindex` rebuilds the
+whole index in one statement. See microblog/models/search.py.
+"""
+from typing import Sequence, Tuple
+
+from sqlalchemy import (
+    BigInteger,
+    Float,
+    Label,
+    Select,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    literal_column,
+    select,
+)
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from microblog.config import config
+from microblog.models.post import Post
+from microblog.models.search import POST_SEARCH, fts_index, pg_index
+from microblog.responses import projection
+
+# postgres text search configuration, e.g. "simple", "english"
+CONFIG = config.search.config
+# ranks are paginated as integers, see `search_query`
+RANK_SCALE = 1_000_000
+
+
+def _document(text):
+    return func.to_tsvector(cast(literal(CONFIG), REGCONFIG), text)
+
+
+def _tsquery(q: str):
+    return func.websearch_to_tsquery(cast(literal(CONFIG), REGCONFIG), q)
+
+
+def _fts_query(q: str) -> str:
+    """Quotes every word so user input is never FTS5 syntax"""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in q.split())
+
+
+async def index_post(session: AsyncSession, post: Post):
+    """Adds a new post to the index, in the caller's transaction"""
+    if session.bind.dialect.name == "postgresql":
+        entry = insert(pg_index).values(
+            post_id=post.id, document=_document(post.text)
+        )
+    else:
+        entry = insert(fts_index).values(rowid=post.id, text=post.text)
+    await session.exec(entry)
+
+
+def search_query(
+    dialect: str, q: str, fields: Sequence[str]
+) -> Tuple[Select, Label]:
+    """Posts matching `q` and their rank, higher is more relevant
+
+    The rank is selected as the last column, paginate by (rank, id).
+    It is rounded to an integer number of millionths: the cursor carries
+    it through JSON, equal ranks must compare equal when it comes back
+    and ties are then ordered by id.
+    """
+    query = projection(Post, fields, ("id",))
+    if dialect == "postgresql":
+        tsquery = _tsquery(q)
+        score = func.ts_rank(pg_index.c.document, tsquery, type_=Float)
+        query = query.join(pg_index, pg_index.c.post_id == Post.id).where(
+            pg_index.c.document.op("@@")(tsquery)
+        )
+    else:
+        # bm25 is negative, more negative is more relevant
+        score = -func.bm25(literal_column(POST_SEARCH), type_=Float)
+        query = query.join(fts_index, fts_index.c.rowid == Post.id).where(
+            literal_column(POST_SEARCH).op("MATCH")(_fts_query(q))
+        )
+    rank = cast(func.round(score * RANK_SCALE), BigInteger).label("rank")
+    return query.add_columns(rank), rank
+
+
+def rebuild(session: Session) -> int:
+    """Reindexes every post"""
+    if session.bind.dialect.name == "postgresql":
+        index = pg_index
+        rows = select(Post.id, _document(Post.text))
+    else:
+        index = fts_index
+        rows = select(Post.id, Post.text)
+    session.exec(delete(index))
+    columns = [c.name for c in index.columns]
+    result = session.exec(insert(index).from_select(columns, rows))
+    return result.rowcount
@@ -1,24 +1,101 @@
 """Security utilities"""
-from passlib.context import CryptContext
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 from pydantic_core import core_schema
+from starlette import status
+from starlette.exceptions import HTTPException
+
+from microblog.config import config
 
-from microblog.config import settings
+SECRET_KEY = config.security.secret_key
+ALGORITHM = config.security.algorithm
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+@lru_cache(maxsize=None)
+def pwd_context():
+    """passlib and bcrypt are imported on the first hash, models and the
+    CLI import this module without needing them"""
+    from passlib.context import CryptContext
 
-SECRET_KEY = settings.security.secret_key
-ALGORITHM = settings.security.algorithm
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def verify_password(plain_password, hashed_password) -> bool:
     """Verifies a hash against a password"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password) -> str:
     """Generates a hash from plain text"""
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
+
+
+class HashingPool:
+    """Bounded thread pool for bcrypt work
+
+    bcrypt releases the GIL, so threads hash in parallel while the event
+    loop keeps serving other requests. Calls beyond `workers` running
+    plus `queue_limit` waiting are rejected with 503 instead of piling up.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.capacity = workers + queue_limit
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bcrypt"
+        )
+        # only touched from the event loop thread
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, func, *args):
+        if self.pending >= self.capacity:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many password checks in progress",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self) -> dict:
+        """Current load, `saturation` above 1.0 means calls are queueing"""
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "running": min(self.pending, self.workers),
+            "queued": max(self.pending - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "saturation": self.pending / self.workers,
+        }
+
+
+hashing_pool = HashingPool(
+    workers=config.security.hash_workers,
+    queue_limit=config.security.hash_queue_limit,
+)
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    """Verifies a hash against a password without blocking the event loop"""
+    return await hashing_pool.run(
+        verify_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password) -> str:
+    """Generates a hash from plain text without blocking the event loop"""
+    return await hashing_pool.run(get_password_hash, password)
 
 
 class HashedPassword(str):
@@ -37,4 +114,4 @@ class HashedPassword(str):
         if not isinstance(value, str):
             raise TypeError("string required")
         hashed_password = get_password_hash(value)
-        return super().__new__(cls, hashed_password)
\ No newline at end of file
+        return super().__new__(cls, hashed_password)
@@ -0,0 +1,244 @@
+"""Synthetic datasets for benchmarks and capacity tests
+
+Everything is drawn from a single `random.Random(seed)` so the same
+arguments always produce the same rows. Rows are written in batches
+with COPY on postgres (psycopg2) and executemany everywhere else.
+"""
+import csv
+import io
+import itertools
+import random
+import time
+from datetime import timedelta
+from typing import Callable, Iterable, Iterator, List
+
+from sqlalchemy import Table, func, select, text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from microblog import counters, search, tags, timeline
+from microblog.models import Like, Post, Social, User
+from microblog.models.utils import utcnow
+from microblog.security import get_password_hash
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua python fastapi "
+    "sqlmodel postgres async cache index query timeline follow like reply"
+).split()
+TAGS = ["python", "fastapi", "postgres", "sqlite", "async", "perf", "news"]
+
+
+def _batches(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, size)):
+        yield batch
+
+
+def _copy(engine: Engine, table: Table, batch: List[dict]):
+    """COPY a batch of rows into a postgres table"""
+    columns = list(batch[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow(["" if row[c] is None else row[c] for c in columns])
+    buffer.seek(0)
+    names = ", ".join(f'"{column}"' for column in columns)
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY "{table.name}" ({names}) FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _executemany(engine: Engine, table: Table, batch: List[dict]):
+    with engine.begin() as connection:
+        connection.execute(table.insert(), batch)
+
+
+def _next_id(engine: Engine, table: Table) -> int:
+    with engine.connect() as connection:
+        last = connection.execute(select(func.max(table.c.id))).scalar()
+    return (last or 0) + 1
+
+
+def _fix_sequence(engine: Engine, table: Table):
+    """Moves the postgres id sequence past the ids set explicitly"""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', "
+                f"'id'), (SELECT max(id) FROM \"{table.name}\"))"
+            )
+        )
+
+
+def _zipf_weights(n: int, exponent: float = 1.0) -> List[float]:
+    """Cumulative weights where rank r is picked ~ 1 / r ** exponent"""
+    return list(
+        itertools.accumulate(1 / (rank ** exponent) for rank in range(1, n + 1))
+    )
+
+
+def seed_database(
+    engine: Engine,
+    *,
+    users: int = 1000,
+    posts: int = 10000,
+    likes: int = 20000,
+    follows: int = 50,
+    reply_ratio: float = 0.3,
+    days: int = 30,
+    password: str = "microblog",
+    prefix: str = "seed",
+    seed: int = 42,
+    batch_size: int = 10000,
+    echo: Callable[[str], None] = print,
+) -> dict:
+    """Fills the database with a repeatable dataset
+
+    - `users` share one bcrypt hash of `password` (hashed once).
+    - Follows: out-degrees are pareto distributed around `follows` and
+      targets are picked by zipf popularity, a power-law graph.
+    - Posts: authors are zipf distributed, `reply_ratio` of them reply
+      to a recent post, building reply trees. Dates spread over `days`.
+    - Likes: users are uniform, posts skewed towards popular ones.
+
+    Returns the rows per second written to each table.
+    """
+    rng = random.Random(seed)
+    copy_rows = (
+        engine.dialect.name == "postgresql"
+        and engine.dialect.driver == "psycopg2"
+    )
+    write = _copy if copy_rows else _executemany
+    stats = {}
+
+    def load(model, rows: Iterable[dict]):
+        table = model.__table__
+        count, started = 0, time.perf_counter()
+        for batch in _batches(rows, batch_size):
+            write(engine, table, batch)
+            count += len(batch)
+        _fix_sequence(engine, table)
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        stats[table.name] = count / elapsed
+        echo(
+            f"{table.name}: {count} rows in {elapsed:.2f}s "
+            f"({count / elapsed:,.0f} rows/s)"
+        )
+
+    # users
+    first_user = _next_id(engine, User.__table__)
+    user_ids = list(range(first_user, first_user + users))
+    hashed = get_password_hash(password)
+    load(User, (
+        {
+            "id": user_id,
+            "email": f"{prefix}{n}@microblog.com",
+            "username": f"{prefix}{n}",
+            "password": hashed,
+            "bio": f"seeded user {n}",
+        }
+        for n, user_id in enumerate(user_ids)
+    ))
+
+    # popularity ranks are shuffled so ids do not predict popularity
+    popular = user_ids[:]
+    rng.shuffle(popular)
+    popular_weights = _zipf_weights(users)
+
+    # follow graph
+    def follow_rows():
+        social_id = _next_id(engine, Social.__table__)
+        alpha = 1.5
+        for user_id in user_ids:
+            degree = int(follows * rng.paretovariate(alpha) * (alpha - 1) / alpha)
+            degree = min(degree, users - 1)
+            targets = set(
+                rng.choices(popular, cum_weights=popular_weights, k=degree)
+            )
+            targets.discard(user_id)
+            for target in sorted(targets):
+                yield {
+                    "id": social_id,
+                    "from": user_id,
+                    "to": target,
+                    "date": utcnow(),
+                }
+                social_id += 1
+
+    load(Social, follow_rows())
+
+    # posts, ids grow with the date so replies always point backwards
+    first_post = _next_id(engine, Post.__table__)
+    start = utcnow() - timedelta(days=days)
+    step = timedelta(days=days) / max(posts, 1)
+
+    def text_for(n: int) -> str:
+        words = rng.choices(WORDS, k=rng.randint(4, 24))
+        if rng.random() < 0.2:
+            words.append(f"#{rng.choice(TAGS)}")
+        if rng.random() < 0.1:
+            words.append(f"@{prefix}{rng.randrange(users)}")
+        return " ".join(words)
+
+    def post_rows():
+        for n in range(posts):
+            post_id = first_post + n
+            parent_id = None
+            if n and rng.random() < reply_ratio:
+                # mostly recent posts get replies
+                distance = int(rng.expovariate(1 / 50)) + 1
+                parent_id = max(post_id - distance, first_post)
+            yield {
+                "id": post_id,
+                "text": text_for(n),
+                "date": start + step * n,
+                "user_id": rng.choices(
+                    popular, cum_weights=popular_weights
+                )[0],
+                "parent_id": parent_id,
+            }
+
+    load(Post, post_rows())
+
+    # likes
+    def like_rows():
+        like_id = _next_id(engine, Like.__table__)
+        seen = set()
+        for _ in range(likes if posts else 0):
+            pair = (
+                rng.choice(user_ids),
+                first_post + int(posts * rng.random() ** 3),
+            )
+            if pair in seen:
+                continue
+            seen.add(pair)
+            yield {
+                "id": like_id,
+                "user": pair[0],
+                "post": pair[1],
+                "date": utcnow(),
+            }
+            like_id += 1
+
+    load(Like, like_rows())
+
+    with Session(engine) as session:
+        counters.reconcile(session)
+        search.rebuild(session)
+        tags.rebuild(session)
+        if timeline.MODE != "read":
+            timeline.rebuild(session)
+        session.commit()
+    echo("counters reconciled, search and tag indexes rebuilt")
+
+    return stats
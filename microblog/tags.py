@@ -0,0 +1,110 @@
+"""Hashtags and mentions
+
+Posts are parsed once, when created: their `#tags` go into `post_tag`
+and the users they `@mention` into `post_mention`. Both are indexed by
+(tag or user, post date, post id), so `/post/tag/{tag}/` and
+`/user/{username}/mentions/` are a range scan and never look at the
+text. Tags are case insensitive, mentions of unknown users are dropped.
+
+`microblog tags-reindex` parses every post again.
+"""
+import re
+from typing import Dict, List
+
+from sqlalchemy import delete, insert, literal
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from microblog.models.post import Post
+from microblog.models.tag import PostMention, PostTag
+from microblog.models.user import User
+
+# not preceded by a word character, so e-mails and url fragments like
+# page#anchor are neither tags nor mentions
+TAG = re.compile(r"(?<!\w)#(\w+)")
+MENTION = re.compile(r"(?<!\w)@(\w+)")
+TAG_MAX_LENGTH = 64
+# posts parsed per query by `rebuild`
+BATCH_SIZE = 5000
+
+
+def normalize_tag(tag: str) -> str:
+    return tag.lstrip("#").lower()
+
+
+def extract_tags(text: str) -> List[str]:
+    """Distinct tags of a text, in order of appearance"""
+    tags = (normalize_tag(tag) for tag in TAG.findall(text))
+    return list(dict.fromkeys(
+        tag for tag in tags if len(tag) <= TAG_MAX_LENGTH
+    ))
+
+
+def extract_mentions(text: str) -> List[str]:
+    """Distinct usernames mentioned in a text"""
+    return list(dict.fromkeys(MENTION.findall(text)))
+
+
+async def index_tags(session: AsyncSession, post: Post):
+    """Writes the tags and mentions of a new post, in the caller's
+    transaction"""
+    tags = extract_tags(post.text)
+    if tags:
+        await session.exec(insert(PostTag).values([
+            {"post_id": post.id, "tag": tag, "post_date": post.date}
+            for tag in tags
+        ]))
+    names = extract_mentions(post.text)
+    if names:
+        mentioned = select(
+            literal(post.id), User.id, literal(post.date, Post.date.type)
+        ).where(User.username.in_(names))
+        await session.exec(
+            insert(PostMention).from_select(
+                ["post_id", "user_id", "post_date"], mentioned
+            )
+        )
+
+
+def rebuild(session: Session) -> Dict[str, int]:
+    """Parses every post again, returns the rows written per table"""
+    session.exec(delete(PostTag))
+    session.exec(delete(PostMention))
+    written = {PostTag.__tablename__: 0, PostMention.__tablename__: 0}
+    last_id = 0
+    while True:
+        posts = session.exec(
+            select(Post.id, Post.text, Post.date)
+            .where(Post.id > last_id)
+            .order_by(Post.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not posts:
+            return written
+        last_id = posts[-1].id
+
+        tags = [
+            {"post_id": post.id, "tag": tag, "post_date": post.date}
+            for post in posts
+            for tag in extract_tags(post.text)
+        ]
+        mentions = {post.id: extract_mentions(post.text) for post in posts}
+        names = {name for found in mentions.values() for name in found}
+        user_ids = dict(session.exec(
+            select(User.username, User.id).where(User.username.in_(names))
+        ).all()) if names else {}
+        mentioned = [
+            {
+                "post_id": post.id,
+                "user_id": user_ids[name],
+                "post_date": post.date,
+            }
+            for post in posts
+            for name in mentions[post.id]
+            if name in user_ids
+        ]
+
+        for model, rows in ((PostTag, tags), (PostMention, mentioned)):
+            if rows:
+                session.exec(insert(model), params=rows)
+                written[model.__tablename__] += len(rows)
@@ -0,0 +1,68 @@
+"""Reply threads loaded with a single recursive query"""
+from typing import Optional
+
+from sqlalchemy import literal
+from sqlalchemy.orm import aliased
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from microblog.models.post import Post, PostResponse, ThreadResponse
+
+COLUMNS = [getattr(Post, name) for name in PostResponse.model_fields]
+
+
+def thread_query(post_id: int, depth: int, page_size: int):
+    """Selects a post and its replies down to `depth` levels
+
+    Every node contributes at most `page_size` + 1 replies, oldest first,
+    the extra one only tells that there are more. Limiting inside the
+    recursion keeps a viral post from walking its whole reply tree.
+    """
+    thread = (
+        select(Post.id, literal(0).label("depth"))
+        .where(Post.id == post_id)
+        .cte("thread", recursive=True)
+    )
+    parent = thread.alias()
+    reply = aliased(Post)
+    first_replies = (
+        select(reply.id)
+        .where(reply.parent_id == parent.c.id)
+        .order_by(reply.date, reply.id)
+        .limit(page_size + 1)
+    )
+    thread = thread.union_all(
+        select(Post.id, (parent.c.depth + 1).label("depth"))
+        .join(parent, Post.parent_id == parent.c.id)
+        .where(parent.c.depth < depth, Post.id.in_(first_replies))
+    )
+    return (
+        select(*COLUMNS)
+        .join(thread, Post.id == thread.c.id)
+        .order_by(thread.c.depth, Post.date, Post.id)
+    )
+
+
+async def load_thread(
+    session: AsyncSession, post_id: int, depth: int, page_size: int
+) -> Optional[ThreadResponse]:
+    """Assembles the nested thread of `post_id` in memory"""
+    rows = (await session.exec(thread_query(post_id, depth, page_size))).all()
+    if not rows:
+        return None
+
+    root = ThreadResponse.model_validate(rows[0])
+    nodes = {root.id: root}
+    # rows come level by level so parents are always seen first
+    for row in rows[1:]:
+        parent = nodes.get(row.parent_id)
+        if parent is None:
+            # below the extra reply of a full page
+            continue
+        if len(parent.replies) == page_size:
+            parent.has_more_replies = True
+            continue
+        node = ThreadResponse.model_validate(row)
+        parent.replies.append(node)
+        nodes[node.id] = node
+    return root
@@ -0,0 +1,216 @@
+"""Home timelines
+
+MODE selects how `/user/timeline` is built:
+
+- "read": fan-out-on-read, queries the posts of every followed user.
+- "write": fan-out-on-write, `create_post` and `follow_user` push post
+  ids into `timeline_entry` and reads are a range scan over it.
+- "hybrid": fan-out-on-write, except for authors with more than
+  FANOUT_MAX_FOLLOWERS followers whose posts are merged in at read time.
+
+In hybrid mode the heavy authors are picked from their current follower
+count, both when writing and when reading. An author who drops to the
+limit or below stops being merged in, and the posts written while heavy
+were never fanned out: `microblog reconcile-counters` materializes the
+authors it demotes, run `microblog timeline-rebuild` after changing MODE
+or FANOUT_MAX_FOLLOWERS. The API only adds followers, an author going
+above the limit keeps the entries already written and reads skip the
+duplicates.
+
+Backfills and rebuilds copy at most BACKFILL_LIMIT posts per followed
+author, older posts of materialized timelines are not reachable.
+"""
+from typing import Iterable, Sequence, Set
+
+from sqlalchemy import delete, exists, func, insert, literal
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from microblog.config import config
+from microblog.models.post import Post
+from microblog.models.social import Social
+from microblog.models.timeline import TimelineEntry
+from microblog.models.user import User
+from microblog.pagination import (
+    Page,
+    PageParams,
+    apply_keyset,
+    build_page,
+    paginate,
+    row_key,
+)
+from microblog.responses import POST_FIELDS, projection
+
+MODE = config.timeline.mode
+FANOUT_MAX_FOLLOWERS = config.timeline.fanout_max_followers
+BACKFILL_LIMIT = config.timeline.backfill_limit
+
+POST_KEYS = (Post.date, Post.id)
+ENTRY_KEYS = (TimelineEntry.post_date, TimelineEntry.post_id)
+POST_KEY = row_key("date", "id")
+
+ENTRY_COLUMNS = ["user_id", "post_id", "author_id", "post_date"]
+
+# posts only change through their counters
+VERSION_FIELDS = ("id", "like_count", "reply_count")
+
+
+async def _follower_count(session: AsyncSession, user_id: int) -> int:
+    query = select(User.follower_count).where(User.id == user_id)
+    return (await session.exec(query)).one()
+
+
+def _heavy_authors():
+    """Authors whose posts are not fanned out in hybrid mode"""
+    return select(User.id).where(User.follower_count > FANOUT_MAX_FOLLOWERS)
+
+
+async def _is_fanned_out(session: AsyncSession, author_id: int) -> bool:
+    if MODE == "write":
+        return True
+    if MODE == "hybrid":
+        followers = await _follower_count(session, author_id)
+        return followers <= FANOUT_MAX_FOLLOWERS
+    return False
+
+
+async def fan_out_post(session: AsyncSession, post: Post):
+    """Pushes a new post into the timelines of the author's followers"""
+    if not await _is_fanned_out(session, post.user_id):
+        return
+    followers = select(
+        Social.from_user_id,
+        literal(post.id),
+        literal(post.user_id),
+        literal(post.date, Post.date.type),
+    ).where(Social.to_user_id == post.user_id)
+    await session.exec(
+        insert(TimelineEntry).from_select(ENTRY_COLUMNS, followers)
+    )
+
+
+async def backfill_follow(
+    session: AsyncSession, follower_id: int, followee_id: int
+):
+    """Copies the recent posts of a newly followed user into a timeline"""
+    if not await _is_fanned_out(session, followee_id):
+        return
+    recent = (
+        select(literal(follower_id), Post.id, Post.user_id, Post.date)
+        .where(Post.user_id == followee_id)
+        .order_by(Post.date.desc())
+        .limit(BACKFILL_LIMIT)
+    )
+    await session.exec(
+        insert(TimelineEntry).from_select(ENTRY_COLUMNS, recent)
+    )
+
+
+def _recent_entries(*where):
+    """Entries for the BACKFILL_LIMIT newest posts of each followed author
+    matching `where`, minus the ones already in the timelines"""
+    newest = func.row_number().over(
+        partition_by=Post.user_id, order_by=(Post.date.desc(), Post.id.desc())
+    )
+    recent = (
+        select(Post.id, Post.user_id, Post.date, newest.label("newest"))
+        .where(*where)
+        .subquery()
+    )
+    written = exists().where(
+        TimelineEntry.user_id == Social.from_user_id,
+        TimelineEntry.post_id == recent.c.id,
+    )
+    return (
+        select(
+            Social.from_user_id, recent.c.id, recent.c.user_id, recent.c.date
+        )
+        .join(recent, recent.c.user_id == Social.to_user_id)
+        .where(recent.c.newest <= BACKFILL_LIMIT, ~written)
+    )
+
+
+def heavy_authors(session: Session) -> Set[int]:
+    """Ids of the authors whose posts are merged in at read time"""
+    if MODE != "hybrid":
+        return set()
+    return set(session.exec(_heavy_authors()).all())
+
+
+def materialize(session: Session, author_ids: Iterable[int]) -> int:
+    """Fans out the recent posts of authors no longer heavy"""
+    author_ids = list(author_ids)
+    if MODE == "read" or not author_ids:
+        return 0
+    entries = _recent_entries(Post.user_id.in_(author_ids))
+    result = session.exec(
+        insert(TimelineEntry).from_select(ENTRY_COLUMNS, entries)
+    )
+    return result.rowcount
+
+
+def rebuild(session: Session) -> int:
+    """Recomputes every materialized timeline from the follow graph"""
+    session.exec(delete(TimelineEntry))
+    if MODE == "read":
+        return 0
+    where = []
+    if MODE == "hybrid":
+        where.append(Post.user_id.not_in(_heavy_authors()))
+    result = session.exec(
+        insert(TimelineEntry).from_select(
+            ENTRY_COLUMNS, _recent_entries(*where)
+        )
+    )
+    return result.rowcount
+
+
+async def read_timeline(
+    session: AsyncSession,
+    user: User,
+    params: PageParams,
+    fields: Sequence[str] = POST_FIELDS,
+) -> Page:
+    """Returns a page of the user's home timeline, newest first
+
+    Rows hold the post columns in `fields` followed by the keyset ones.
+    """
+    posts = projection(Post, fields, ("date", "id"))
+    following = select(Social.to_user_id).where(
+        Social.from_user_id == user.id
+    )
+
+    if MODE == "read":
+        query = posts.where(Post.user_id.in_(following))
+        return await paginate(session, query, params, keys=POST_KEYS)
+
+    materialized = (
+        posts
+        .join(TimelineEntry, TimelineEntry.post_id == Post.id)
+        .where(TimelineEntry.user_id == user.id)
+    )
+    if MODE == "write":
+        return await paginate(
+            session, materialized, params, keys=ENTRY_KEYS, key=POST_KEY
+        )
+
+    # hybrid: merge the materialized page with the posts of heavy authors,
+    # both sides are ordered by the same keyset so limit + 1 of each is
+    # enough to build the page
+    heavy_following = following.where(Social.to_user_id.in_(_heavy_authors()))
+    heavy = posts.where(Post.user_id.in_(heavy_following))
+    rows = {}
+    for query, keys in ((materialized, ENTRY_KEYS), (heavy, POST_KEYS)):
+        for post in await session.exec(apply_keyset(query, params, keys)):
+            rows[post.id] = post
+    merged = sorted(rows.values(), key=POST_KEY, reverse=not params.ascending)
+    return build_page(merged[: params.limit + 1], params, POST_KEY)
+
+
+async def timeline_version(
+    session: AsyncSession, user: User, params: PageParams
+) -> list:
+    """Ids and counters of a timeline page, what its ETag is made of,
+    read without the text of the posts"""
+    page = await read_timeline(session, user, params, VERSION_FIELDS)
+    return [tuple(row) for row in page.items]
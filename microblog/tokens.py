@@ -0,0 +1,86 @@
+"""JWT backends
+
+Both backends take and return plain claim dicts and raise `TokenError`
+for anything that does not verify, so the rest of the app does not care
+which library signs the tokens. Tokens without an `exp` claim do not
+verify.
+"""
+
+
+class TokenError(Exception):
+    """Token is malformed, expired or has a bad signature"""
+
+
+class JoseBackend:
+    """python-jose, the default"""
+
+    def __init__(self, secret_key: str, algorithm: str):
+        from jose import JWTError, jwt
+
+        self._jwt = jwt
+        self._error = JWTError
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+
+    def encode(self, claims: dict) -> str:
+        return self._jwt.encode(
+            claims, self.secret_key, algorithm=self.algorithm
+        )
+
+    def decode(self, token: str) -> dict:
+        try:
+            return self._jwt.decode(
+                token,
+                self.secret_key,
+                algorithms=[self.algorithm],
+                options={"require_exp": True},
+            )
+        except self._error as e:
+            raise TokenError(str(e)) from e
+
+
+class PyJWTBackend:
+    """PyJWT, a leaner verifier (`pip install pyjwt`)"""
+
+    def __init__(self, secret_key: str, algorithm: str):
+        try:
+            import jwt
+        except ImportError:
+            raise RuntimeError(
+                "security.jwt_backend = 'pyjwt' needs `pip install pyjwt`"
+            )
+
+        self._jwt = jwt
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+
+    def encode(self, claims: dict) -> str:
+        return self._jwt.encode(
+            claims, self.secret_key, algorithm=self.algorithm
+        )
+
+    def decode(self, token: str) -> dict:
+        try:
+            return self._jwt.decode(
+                token,
+                self.secret_key,
+                algorithms=[self.algorithm],
+                options={"require": ["exp"]},
+            )
+        except self._jwt.PyJWTError as e:
+            raise TokenError(str(e)) from e
+
+
+BACKENDS = {
+    "jose": JoseBackend,
+    "pyjwt": PyJWTBackend,
+}
+
+
+def get_backend(name: str, secret_key: str, algorithm: str):
+    """Instantiates the backend configured in `security.jwt_backend`"""
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise RuntimeError(f"Unknown JWT backend {name!r}")
+    return backend(secret_key, algorithm)
@@ -1,5 +1,5 @@
 from microblog import models
-from microblog.config import settings
+from microblog.config import config as app_config
 from microblog.db import engine
 
 from logging.config import fileConfig
@@ -29,6 +29,13 @@ target_metadata = models.SQLModel.metadata
 # ... etc.
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    """Leaves alone tables created by DDL events (microblog.models.search)"""
+    if type_ == "table" and reflected and compare_to is None:
+        return name != "post_search"
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -41,10 +48,11 @@ def run_migrations_offline():
     script output.
 
     """
-    url = settings.db.uri
+    url = app_config.db.uri
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -64,7 +72,9 @@ def run_migrations_online():
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,45 @@
+"""post_search
+
+Revision ID: 9c4f2a7b1d35
+Revises: 5e8a0c3f6d12
+Create Date: 2026-10-18 15:02:44.118520
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4f2a7b1d35'
+down_revision = '5e8a0c3f6d12'
+branch_labels = None
+depends_on = None
+
+# keep in sync with search.config in microblog/default.toml
+CONFIG = 'simple'
+
+
+def upgrade():
+    # full-text index, created by DDL events in microblog/models/search.py
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('CREATE VIRTUAL TABLE post_search USING fts5(text)')
+        op.execute(
+            'INSERT INTO post_search (rowid, text) SELECT id, text FROM post'
+        )
+        return
+    op.execute(
+        'CREATE TABLE post_search ('
+        'post_id INTEGER PRIMARY KEY REFERENCES post (id) ON DELETE CASCADE, '
+        'document TSVECTOR NOT NULL)'
+    )
+    op.execute(
+        'INSERT INTO post_search (post_id, document) '
+        f"SELECT id, to_tsvector('{CONFIG}', text) FROM post"
+    )
+    op.execute(
+        'CREATE INDEX ix_post_search_document '
+        'ON post_search USING gin (document)'
+    )
+
+
+def downgrade():
+    op.execute('DROP TABLE post_search')
@@ -0,0 +1,63 @@
+"""hot_path_indexes
+
+Revision ID: b7d4e1f9a2c3
+Revises: 3b9e2c7d41a6
+Create Date: 2026-10-18 11:03:47.218930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d4e1f9a2c3'
+down_revision = '3b9e2c7d41a6'
+branch_labels = None
+depends_on = None
+
+ROOT_POSTS = sa.text('parent_id IS NULL')
+
+# name, table, columns, unique, extra kwargs
+INDEXES = [
+    ('ix_post_user_date', 'post', ['user_id', 'date', 'id'], False, {}),
+    ('ix_post_parent_date', 'post', ['parent_id', 'date', 'id'], False, {}),
+    ('ix_post_root_date', 'post', ['date', 'id'], False,
+     {'postgresql_where': ROOT_POSTS, 'sqlite_where': ROOT_POSTS}),
+    ('uq_social_from_to', 'social', ['from', 'to'], True, {}),
+    ('ix_social_to_from', 'social', ['to', 'from'], False, {}),
+    ('uq_like_user_post', 'like', ['user', 'post'], True, {}),
+    ('ix_like_post', 'like', ['post'], False, {}),
+]
+
+
+def upgrade():
+    # keep the oldest row of duplicated follows and likes so the unique
+    # indexes can be built
+    op.execute(
+        'DELETE FROM social WHERE id NOT IN '
+        '(SELECT min(id) FROM social GROUP BY "from", "to")'
+    )
+    op.execute(
+        'DELETE FROM "like" WHERE id NOT IN '
+        '(SELECT min(id) FROM "like" GROUP BY "user", post)'
+    )
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction, it does
+    # not lock the tables for writes while building on postgres
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique, kwargs in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=unique,
+                postgresql_concurrently=True,
+                **kwargs
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique, kwargs in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
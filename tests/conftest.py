@@ -1,5 +1,14 @@
 import os
 
+# the test database, microblog reads its settings on import
+os.environ.setdefault(
+    "MICROBLOG_DB__uri", "postgresql://postgres:postgres@db:5432/microblog_test"
+)
+os.environ.setdefault("MICROBLOG_DB__null_pool", "true")
+
+import asyncio
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import text
@@ -7,10 +16,11 @@ from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session
 
 from microblog.app import app
+from microblog.auth import user_cache
 from microblog.cli import create_user
 from microblog.db import engine
-
-os.environ["MICROBLOG_DB__uri"] = "postgresql://postgres:postgres@db:5432/microblog_test"
+from microblog.ratelimit import limiter
+from microblog.response_cache import response_cache
 
 
 @pytest.fixture(scope="function", autouse=True)
@@ -18,11 +28,19 @@ def clean_database():
     """Clean database between tests"""
     with Session(engine) as session:
         # Delete all data from tables
+        session.execute(text('DELETE FROM "timeline_entry"'))
         session.execute(text('DELETE FROM "like"'))
+        session.execute(text('DELETE FROM "post_search"'))
+        session.execute(text('DELETE FROM "post_tag"'))
+        session.execute(text('DELETE FROM "post_mention"'))
         session.execute(text('DELETE FROM "post"'))
         session.execute(text('DELETE FROM "social"'))
         session.execute(text('DELETE FROM "user"'))
         session.commit()
+    # raw deletes bypass the ORM events and routes that invalidate caches
+    user_cache.clear()
+    asyncio.run(response_cache.clear())
+    asyncio.run(limiter.clear())
     yield
 
 
@@ -54,4 +72,14 @@ def api_client_user1():
 
 @pytest.fixture(scope="function")
 def api_client_user2():
-    return create_api_client_authenticated("user2")
\ No newline at end of file
+    return create_api_client_authenticated("user2")
+
+
+def texts(response) -> list:
+    """Texts of the posts in a page response"""
+    return [post["text"] for post in response.json()["items"]]
+
+
+def lines(body: bytes) -> list:
+    """Parsed lines of an NDJSON body"""
+    return [json.loads(line) for line in body.splitlines()]
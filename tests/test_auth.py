@@ -0,0 +1,138 @@
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from microblog.auth import (
+    create_access_token,
+    decode_token,
+    token_cache,
+    user_cache,
+)
+from microblog.cli import create_user, reconcile_counters
+from microblog.db import engine
+from microblog.models.user import User
+from microblog.security import hashing_pool
+from microblog.tokens import TokenError, get_backend
+
+
+def test_login(api_client: TestClient):
+    """Test exchanging username and password for tokens"""
+    create_user("login@microblog.com", "login", "login")
+    response = api_client.post(
+        "/token", data={"username": "login", "password": "login"}
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert result["token_type"] == "bearer"
+    assert result["access_token"]
+    assert result["refresh_token"]
+
+
+def test_login_wrong_password(api_client: TestClient):
+    """Test login with a wrong password"""
+    create_user("login@microblog.com", "login", "login")
+    response = api_client.post(
+        "/token", data={"username": "login", "password": "wrong"}
+    )
+    assert response.status_code == 401
+
+
+def test_login_hashing_pool_full(monkeypatch, api_client: TestClient):
+    """Test logins are shed when the bcrypt pool is saturated"""
+    create_user("login@microblog.com", "login", "login")
+    monkeypatch.setattr(hashing_pool, "capacity", 0)
+    rejected = hashing_pool.rejected
+
+    response = api_client.post(
+        "/token", data={"username": "login", "password": "login"}
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert hashing_pool.stats()["rejected"] == rejected + 1
+
+
+def test_authenticated_user_is_cached(api_client_user1: TestClient):
+    """Test the authenticated user is cached and dropped when it changes"""
+    api_client_user1.get("/user/timeline")
+    cached = user_cache.get("user1")
+    assert cached["username"] == "user1"
+
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.username == "user1")).one()
+        user.bio = "changed"
+        session.add(user)
+        session.commit()
+    assert user_cache.get("user1") is None
+
+    response = api_client_user1.get("/user/timeline")
+    assert response.status_code == 200
+    assert user_cache.get("user1")["bio"] == "changed"
+
+
+def test_counter_updates_drop_cached_users(
+    api_client_user1: TestClient, api_client_user2: TestClient
+):
+    """Test follows and reconciling drop the users with stale counters"""
+    user2 = api_client_user2.get("/user/user2/").json()
+    assert user_cache.get("user1") and user_cache.get("user2")
+
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+    assert user_cache.get("user1") is None
+    assert user_cache.get("user2") is None
+
+    api_client_user1.get("/user/timeline")
+    assert user_cache.get("user1")["following_count"] == 1
+    reconcile_counters()
+    assert user_cache.get("user1") is None
+
+
+def test_verified_token_is_cached():
+    """Test decoded tokens are memoized by digest"""
+    token = create_access_token({"sub": "cached"})
+    payload = decode_token(token)
+    assert payload["sub"] == "cached"
+    assert decode_token(token) is payload
+    assert len(token_cache) >= 1
+
+
+def test_revoked_token(monkeypatch, api_client_user1: TestClient):
+    """Test revocation hooks are honoured for cached tokens"""
+    assert api_client_user1.get("/user/timeline").status_code == 200
+
+    monkeypatch.setattr(
+        "microblog.auth.revocation_hooks",
+        [lambda payload: payload["sub"] == "user1"],
+    )
+    response = api_client_user1.get("/user/timeline")
+    assert response.status_code == 401
+
+
+def test_expired_token():
+    """Test an expired token is rejected"""
+    token = create_access_token({"sub": "expired"}, timedelta(seconds=-1))
+    with pytest.raises(TokenError):
+        decode_token(token)
+
+
+def test_pyjwt_backend():
+    """Test the pyjwt backend verifies tokens signed by jose"""
+    pytest.importorskip("jwt")
+    backend = get_backend("pyjwt", "s" * 32, "HS256")
+    jose = get_backend("jose", "s" * 32, "HS256")
+    token = jose.encode({"sub": "someone", "exp": time.time() + 60})
+    assert backend.decode(token)["sub"] == "someone"
+    with pytest.raises(TokenError):
+        backend.decode(token + "x")
+
+
+@pytest.mark.parametrize("name", ["jose", "pyjwt"])
+def test_token_without_exp(name):
+    """Test a signed token without expiration is rejected"""
+    pytest.importorskip("jose" if name == "jose" else "jwt")
+    backend = get_backend(name, "s" * 32, "HS256")
+    token = backend.encode({"sub": "forever"})
+    with pytest.raises(TokenError):
+        backend.decode(token)
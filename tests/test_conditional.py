@@ -0,0 +1,126 @@
+from fastapi.testclient import TestClient
+
+
+def test_post_etag(api_client_user1: TestClient, api_client_user2: TestClient):
+    """Test a post answers 304 until it is liked or replied to"""
+    post = api_client_user1.post("/post/", json={"text": "Poll me"}).json()
+    url = f"/post/{post['id']}/"
+
+    response = api_client_user1.get(url)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    assert response.headers["cache-control"] == "no-cache"
+
+    response = api_client_user1.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    # likes and replies change the representation
+    api_client_user2.post(f"{url}like/")
+    response = api_client_user1.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["like_count"] == 1
+    liked = response.headers["etag"]
+
+    api_client_user2.post(
+        "/post/", json={"text": "Reply", "parent_id": post["id"]}
+    )
+    response = api_client_user1.get(url, headers={"If-None-Match": liked})
+    assert response.status_code == 200
+    assert len(response.json()["replies"]) == 1
+
+
+def test_no_last_modified(
+    api_client_user1: TestClient, api_client_user2: TestClient
+):
+    """Test If-Modified-Since never hides a like"""
+    post = api_client_user1.post("/post/", json={"text": "Dated"}).json()
+    url = f"/post/{post['id']}/"
+    assert "last-modified" not in api_client_user1.get(url).headers
+
+    # a like does not move any date, If-Modified-Since must not hide it
+    api_client_user2.post(f"{url}like/")
+    response = api_client_user1.get(
+        url, headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+    )
+    assert response.status_code == 200
+    assert response.json()["like_count"] == 1
+
+
+def test_post_etag_not_found(api_client: TestClient):
+    """Test If-None-Match on a missing post is a 404"""
+    response = api_client.get("/post/99999/", headers={"If-None-Match": "*"})
+    assert response.status_code == 404
+
+
+def test_user_etag(api_client_user1: TestClient, api_client_user2: TestClient):
+    """Test a user profile answers 304 until it is followed"""
+    response = api_client_user1.get("/user/user2/")
+    etag = response.headers["etag"]
+    response = api_client_user1.get(
+        "/user/user2/", headers={"If-None-Match": f'"x", {etag}'}
+    )
+    assert response.status_code == 304
+
+    user2 = api_client_user1.get("/user/user2/").json()
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+    response = api_client_user1.get(
+        "/user/user2/", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["follower_count"] == 1
+
+
+def test_timeline_etag(
+    api_client_user1: TestClient, api_client_user2: TestClient
+):
+    """Test the timeline answers 304 until a followed user posts"""
+    user2 = api_client_user1.get("/user/user2/").json()
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+    api_client_user2.post("/post/", json={"text": "First"})
+
+    response = api_client_user1.get("/user/timeline")
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+    assert "last-modified" not in response.headers
+    response = api_client_user1.get(
+        "/user/timeline", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    api_client_user2.post("/post/", json={"text": "Second"})
+    response = api_client_user1.get(
+        "/user/timeline", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert [p["text"] for p in response.json()["items"]] == [
+        "Second", "First"
+    ]
+    posted = response.headers["etag"]
+
+    # counters are part of the version, a like is a new representation
+    second = response.json()["items"][0]
+    api_client_user1.post(f"/post/{second['id']}/like/")
+    response = api_client_user1.get(
+        "/user/timeline", headers={"If-None-Match": posted}
+    )
+    assert response.status_code == 200
+    assert response.json()["items"][0]["like_count"] == 1
+
+
+def test_timeline_ignores_if_modified_since(
+    api_client_user1: TestClient, api_client_user2: TestClient
+):
+    """Test If-Modified-Since never answers 304 for the timeline"""
+    user2 = api_client_user1.get("/user/user2/").json()
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+    api_client_user2.post("/post/", json={"text": "Dated"})
+
+    response = api_client_user1.get(
+        "/user/timeline",
+        headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"},
+    )
+    assert response.status_code == 200
+    assert [p["text"] for p in response.json()["items"]] == ["Dated"]
@@ -0,0 +1,66 @@
+import gzip
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from microblog import export
+from microblog.db import engine
+from microblog.models import User
+from tests.conftest import lines
+
+
+def test_export_posts(api_client_user1: TestClient):
+    """Test exporting a user's posts as NDJSON"""
+    for i in range(3):
+        api_client_user1.post("/post/", json={"text": f"post {i}"})
+
+    response = api_client_user1.get("/user/user1/export/posts")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "user1-posts.ndjson" in response.headers["content-disposition"]
+    rows = lines(response.content)
+    assert [row["text"] for row in rows] == ["post 0", "post 1", "post 2"]
+    # same objects as the JSON API
+    listed = api_client_user1.get("/post/user/user1/").json()["items"]
+    assert rows == listed[::-1]
+
+    response = api_client_user1.get("/user/user1/export/posts?gzip=true")
+    assert response.headers["content-type"] == "application/gzip"
+    assert lines(gzip.decompress(response.content)) == rows
+
+    assert api_client_user1.get("/user/nobody/export/posts").status_code == 404
+
+
+def test_export_likes(
+    api_client: TestClient,
+    api_client_user1: TestClient,
+    api_client_user2: TestClient,
+):
+    """Test exporting the posts a user liked"""
+    post = api_client_user1.post("/post/", json={"text": "liked"}).json()
+    api_client_user2.post(f"/post/{post['id']}/like/")
+
+    assert api_client.get("/user/user2/export/likes").status_code == 401
+    response = api_client_user1.get("/user/user2/export/likes")
+    assert response.status_code == 200
+    [row] = lines(response.content)
+    assert row["id"] == post["id"]
+    assert row["liked_at"]
+
+
+def test_export_batches(api_client_user1: TestClient, monkeypatch):
+    """Test the export reads the posts in batches"""
+    for i in range(5):
+        api_client_user1.post("/post/", json={"text": f"post {i}"})
+    monkeypatch.setattr(export, "YIELD_PER", 2)
+
+    with Session(engine) as session:
+        user_id = session.exec(
+            select(User.id).where(User.username == "user1")
+        ).one()
+        query, fields = export.posts_query(user_id)
+        chunks = list(export.iter_ndjson(session, query, fields))
+    # one chunk per fetched batch
+    assert [len(chunk.splitlines()) for chunk in chunks] == [2, 2, 1]
+    body = gzip.decompress(b"".join(export.gzipped(chunks)))
+    assert len(lines(body)) == 5
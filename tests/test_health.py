@@ -0,0 +1,62 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from microblog.db import TimedQueuePool, engine, pool_stats
+from microblog.routes import health
+
+
+def test_ready(api_client: TestClient):
+    """Test the readiness probe with the database up"""
+    response = api_client.get("/health/ready")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] in ("ready", "saturated")
+    assert body["database"] == "ok"
+    assert set(body["pools"]) == {"sync", "async"}
+
+
+def test_ready_database_down(api_client: TestClient, monkeypatch, tmp_path):
+    """Test the readiness probe fails without a database"""
+    missing = tmp_path / "missing" / "db.sqlite"
+    unreachable = create_async_engine(f"sqlite+aiosqlite:///{missing}")
+    monkeypatch.setattr(health, "async_engine", unreachable)
+    response = api_client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "unavailable"
+
+
+def test_pool_stats(api_client: TestClient):
+    """Test the pool statistics count connection checkouts"""
+    before = api_client.get("/health/pool").json()["sync"]
+    # requests use the async engine, NullPool in tests
+    with engine.connect():
+        pass
+    sync = api_client.get("/health/pool").json()["sync"]
+    assert sync["class"] == "TimedQueuePool"
+    assert sync["size"] == 5
+    assert sync["checked_out"] == 0
+    assert sync["wait_seconds"]["count"] == before["wait_seconds"]["count"] + 1
+
+
+def test_timed_pool(tmp_path):
+    """Test the pool times checkouts and counts timeouts"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.01,
+    )
+    waits = []
+    engine.pool.wait_observers.append(waits.append)
+    with engine.connect():
+        assert pool_stats(engine)["checked_out"] == 1
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+    assert pool_stats(engine)["timeouts"] == 1
+    assert len(waits) == 2 and waits[1] >= 0.01
+
+    engine.dispose()
+    assert engine.pool.wait_observers == [waits.append]
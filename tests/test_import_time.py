@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+# seconds, the budgets of benchmarks/bench_import.py: about twice the
+# usual numbers
+BUDGETS = {"microblog.cli": 0.4, "microblog.app": 2.5}
+
+
+def cold_import(module: str) -> dict:
+    """Imports `module` in a new interpreter, returns the seconds it took
+    and the heavy packages it loaded"""
+    code = (
+        "import json, sys, time; started = time.perf_counter(); "
+        f"import {module}; seconds = time.perf_counter() - started; "
+        "heavy = ('fastapi', 'passlib', 'jose', 'jwt', 'bcrypt'); "
+        "print(json.dumps({'seconds': seconds, "
+        "'loaded': [name for name in heavy if name in sys.modules]}))"
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], env=os.environ.copy()
+    )
+    return json.loads(output)
+
+
+def test_cli_does_not_import_the_web_stack():
+    """Test the CLI imports neither the app nor passlib"""
+    result = cold_import("microblog.cli")
+    assert result["loaded"] == []
+    assert result["seconds"] < BUDGETS["microblog.cli"]
+
+
+def test_models_do_not_import_fastapi_or_passlib():
+    """Test the models import neither fastapi nor passlib"""
+    assert cold_import("microblog.models")["loaded"] == []
+
+
+def test_app_defers_password_and_token_libraries():
+    """Test the app imports passlib and jose on first use"""
+    result = cold_import("microblog.app")
+    assert result["loaded"] == ["fastapi"]
+    assert result["seconds"] < BUDGETS["microblog.app"]
@@ -55,6 +55,7 @@ def test_get_user_liked_posts(api_client_user1: TestClient, api_client_user2: Te
     liked_post_ids = {post["id"] for post in liked_posts}
     assert posts[0]["id"] in liked_post_ids
     assert posts[2]["id"] in liked_post_ids
+    assert set(liked_posts[0]) == set(posts[0])
     assert posts[1]["id"] not in liked_post_ids
 
 def test_get_likes_nonexistent_user(api_client_user1: TestClient):
@@ -73,4 +74,18 @@ def test_get_likes_unauthorized(api_client: TestClient):
     """Test getting likes without authentication"""
     response = api_client.get("/post/likes/user1/")
     assert response.status_code == 401
-    assert "Not authenticated" in response.json()["detail"] 
\ No newline at end of file
+    assert "Not authenticated" in response.json()["detail"] 
+
+
+def test_like_count(api_client_user1: TestClient, api_client_user2: TestClient):
+    """Test likes are counted on the post"""
+    post = api_client_user2.post("/post/", json={"text": "Count me"}).json()
+    assert post["like_count"] == 0
+
+    api_client_user1.post(f"/post/{post['id']}/like/")
+    api_client_user2.post(f"/post/{post['id']}/like/")
+    # a repeated like is not counted
+    api_client_user1.post(f"/post/{post['id']}/like/")
+
+    response = api_client_user1.get(f"/post/{post['id']}/")
+    assert response.json()["like_count"] == 2
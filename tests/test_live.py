@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from microblog import live
+
+
+def test_hub_dispatch():
+    """Test the hub queues posts for the followers of their author"""
+    async def run():
+        hub = live.Hub()
+        async with hub.subscribe([1, 2]) as subscription:
+            assert hub.subscribers == 1
+            assert hub.dispatch({"id": 10, "user_id": 1}) == 1
+            assert hub.dispatch({"id": 11, "user_id": 3}) == 0
+            assert await subscription.get() == {"id": 10, "user_id": 1}
+            assert subscription.queue.empty()
+        assert hub.subscribers == 0
+        assert not hub.wants(1)
+
+    asyncio.run(run())
+
+
+def test_hub_overflow():
+    """Test a subscriber falling behind gets an overflow"""
+    async def run():
+        hub = live.Hub()
+        async with hub.subscribe([1], size=2) as subscription:
+            for post_id in range(3):
+                hub.dispatch({"id": post_id, "user_id": 1})
+            # the backlog is dropped, the subscriber gets the overflow
+            assert await subscription.get() is live.OVERFLOW
+            hub.dispatch({"id": 4, "user_id": 1})
+            assert subscription.queue.empty()
+
+    asyncio.run(run())
+
+
+def test_sse_stream(monkeypatch):
+    """Test the event stream sends pings and posts"""
+    hub = live.Hub()
+    monkeypatch.setattr(live, "hub", hub)
+    monkeypatch.setattr(live, "HEARTBEAT", 0.01)
+
+    async def run():
+        stream = live.sse_stream([1])
+        assert await stream.__anext__() == b"retry: 5000\n\n"
+        assert await stream.__anext__() == b": ping\n\n"
+        hub.dispatch({"id": 7, "user_id": 1})
+        message = await stream.__anext__()
+        assert message.startswith(b"id: 7\nevent: post\ndata: {")
+        await stream.aclose()
+        assert hub.subscribers == 0
+
+    asyncio.run(run())
+
+
+def test_timeline_websocket(
+    api_client: TestClient,
+    api_client_user1: TestClient,
+    api_client_user2: TestClient,
+):
+    """Test a followed user's new post is pushed over WebSocket"""
+    user2 = api_client.get("/user/user2/").json()
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+    token = api_client_user1.headers["Authorization"].split(" ")[1]
+
+    with api_client.websocket_connect(
+        f"/user/timeline/ws?token={token}"
+    ) as websocket:
+        api_client_user2.post("/post/", json={"text": "live post"})
+        message = websocket.receive_json()
+    assert message["event"] == "post"
+    assert message["data"]["text"] == "live post"
+    assert message["data"]["user_id"] == user2["id"]
+    assert live.hub.subscribers == 0
+
+
+def test_timeline_websocket_requires_token(api_client: TestClient):
+    """Test the WebSocket is closed without a valid token"""
+    with pytest.raises(WebSocketDisconnect):
+        with api_client.websocket_connect("/user/timeline/ws?token=bad"):
+            pass
+
+
+def test_timeline_stream_requires_token(api_client: TestClient):
+    """Test the event stream is refused without a valid token"""
+    response = api_client.get(
+        "/user/timeline/stream", headers={"Authorization": "Bearer bad"}
+    )
+    assert response.status_code == 401
+
+
+class FakeConnection:
+    def __init__(self):
+        self.on_terminate = []
+
+    def add_termination_listener(self, callback):
+        self.on_terminate.append(callback)
+
+    async def add_listener(self, channel, callback):
+        pass
+
+    async def close(self):
+        pass
+
+
+def test_postgres_broker_reconnects(monkeypatch):
+    """Test the LISTEN connection is reopened after it drops"""
+    pytest.importorskip("asyncpg")
+    monkeypatch.setattr(live, "RECONNECT_DELAY", 0)
+    connections = []
+
+    async def connect(dsn):
+        if len(connections) == 1:
+            # the first attempt after the drop fails too
+            connections.append(None)
+            raise OSError("connection refused")
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    async def run():
+        broker = live.PostgresBroker()
+        monkeypatch.setattr(broker.asyncpg, "connect", connect)
+        await broker.start()
+        connections[0].on_terminate[0](connections[0])
+        await broker.reconnecting
+        assert broker.listener is connections[2]
+        assert broker.reconnecting is None
+        await broker.stop()
+
+    asyncio.run(run())
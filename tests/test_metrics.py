@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+
+from microblog.metrics import Histogram
+
+
+def test_metrics_route_templates(api_client: TestClient):
+    """Test requests are counted by route template"""
+    api_client.get("/post/")
+    api_client.get("/post/999999/")
+    api_client.get("/does-not-exist")
+    response = api_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert (
+        'microblog_http_requests_total{method="GET",route="/post/",'
+        'status="200"}'
+    ) in body
+    assert (
+        'microblog_http_requests_total{method="GET",'
+        'route="/post/{post_id}/",status="404"}'
+    ) in body
+    assert 'route="unmatched",status="404"}' in body
+    assert "# TYPE microblog_http_request_duration_seconds histogram" in body
+    assert "microblog_http_requests_in_progress 1" in body
+    assert "microblog_hash_pool_queued 0" in body
+    assert "microblog_db_pool_checkouts_total" in body
+
+
+def test_histogram_buckets():
+    """Test histograms render cumulative buckets"""
+    histogram = Histogram("h", "help", ["route"], buckets=[0.1, 1.0])
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, "/x/")
+    lines = histogram.render()
+    assert 'h_bucket{route="/x/",le="0.1"} 2' in lines
+    assert 'h_bucket{route="/x/",le="1.0"} 3' in lines
+    assert 'h_bucket{route="/x/",le="+Inf"} 4' in lines
+    assert 'h_count{route="/x/"} 4' in lines
+    assert 'h_sum{route="/x/"} 3.65' in lines
+
+
+def test_loop_lag_monitor_runs_with_the_app():
+    """Test the event loop lag is measured while the app runs"""
+    from microblog.app import app
+
+    with TestClient(app) as client:
+        response = client.get("/metrics")
+    assert "# TYPE microblog_event_loop_lag_seconds gauge" in response.text
@@ -1,6 +1,12 @@
+import asyncio
+import base64
+
 import pytest
 from fastapi.testclient import TestClient
 
+from microblog.response_cache import response_cache
+
+
 def test_create_post(api_client_user1: TestClient):
     """Test creating a new post"""
     response = api_client_user1.post(
@@ -53,7 +59,7 @@ def test_list_posts(api_client_user1: TestClient):
     
     response = api_client_user1.get("/post/")
     assert response.status_code == 200
-    results = response.json()
+    results = response.json()["items"]
     for result in results:
         assert result["parent_id"] is None
         assert "text" in result
@@ -106,7 +112,7 @@ def test_get_user_posts(api_client_user1: TestClient):
     # Get user posts
     response = api_client_user1.get("/post/user/user1/")
     assert response.status_code == 200
-    results = response.json()
+    results = response.json()["items"]
     assert len(results) == 3
     for result in results:
         assert "Post" in result["text"]
@@ -138,5 +144,174 @@ def test_get_user_posts_with_replies(api_client_user1: TestClient):
         params={"include_replies": True}
     )
     assert response.status_code == 200
-    results = response.json()
-    assert len(results) == 3  # Original post + 2 replies 
\ No newline at end of file
+    results = response.json()["items"]
+    assert len(results) == 3  # Original post + 2 replies 
+
+def test_list_posts_pagination(api_client_user1: TestClient):
+    """Test walking the post list with keyset cursors"""
+    for i in range(5):
+        api_client_user1.post("/post/", json={"text": f"Paged post {i+1}"})
+
+    response = api_client_user1.get("/post/", params={"limit": 2})
+    assert response.status_code == 200
+    first_page = response.json()
+    assert [p["text"] for p in first_page["items"]] == [
+        "Paged post 5", "Paged post 4"
+    ]
+    assert first_page["next_cursor"]
+
+    response = api_client_user1.get(
+        "/post/", params={"limit": 2, "before": first_page["next_cursor"]}
+    )
+    second_page = response.json()
+    assert [p["text"] for p in second_page["items"]] == [
+        "Paged post 3", "Paged post 2"
+    ]
+
+    response = api_client_user1.get(
+        "/post/", params={"limit": 2, "before": second_page["next_cursor"]}
+    )
+    last_page = response.json()
+    assert [p["text"] for p in last_page["items"]] == ["Paged post 1"]
+    assert last_page["next_cursor"] is None
+
+    # Walking back to newer posts
+    response = api_client_user1.get(
+        "/post/", params={"limit": 2, "after": last_page["prev_cursor"]}
+    )
+    assert [p["text"] for p in response.json()["items"]] == [
+        "Paged post 3", "Paged post 2"
+    ]
+
+
+def test_list_posts_invalid_cursor(api_client: TestClient):
+    """Test a malformed cursor is rejected"""
+    response = api_client.get("/post/", params={"before": "not-a-cursor"})
+    assert response.status_code == 400
+    assert "Invalid cursor" in response.json()["detail"]
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        '["2020-01-01T00:00:00",1000000000000000000000000000000]',
+        '["2020-01-01T00:00:00",1e400]',
+        '["2020-01-01T00:00:00",1.5]',
+        '["2020-01-01T00:00:00",true]',
+        '["2020-01-01T00:00:00","1"]',
+        '["2020-01-01T00:00:00+02:00",1]',
+        '[20200101,1]',
+    ],
+)
+def test_list_posts_out_of_range_cursor(api_client: TestClient, payload):
+    """Test a cursor with values outside its column types is rejected"""
+    cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+    response = api_client.get("/post/", params={"before": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_get_thread(api_client_user1: TestClient, api_client_user2: TestClient):
+    """Test loading a nested reply tree with depth and page size limits"""
+    root = api_client_user1.post("/post/", json={"text": "Root"}).json()
+    replies = [
+        api_client_user2.post(
+            "/post/", json={"text": f"Reply {i+1}", "parent_id": root["id"]}
+        ).json()
+        for i in range(3)
+    ]
+    nested = api_client_user1.post(
+        "/post/", json={"text": "Nested", "parent_id": replies[0]["id"]}
+    ).json()
+    api_client_user2.post(
+        "/post/", json={"text": "Too deep", "parent_id": nested["id"]}
+    )
+
+    response = api_client_user1.get(
+        f"/post/{root['id']}/thread/", params={"depth": 2, "page_size": 2}
+    )
+    assert response.status_code == 200
+    thread = response.json()
+    assert thread["text"] == "Root"
+    assert thread["has_more_replies"] is True
+    assert [r["text"] for r in thread["replies"]] == ["Reply 1", "Reply 2"]
+    first = thread["replies"][0]
+    assert [r["text"] for r in first["replies"]] == ["Nested"]
+    assert first["replies"][0]["replies"] == []
+
+
+def test_get_thread_not_found(api_client: TestClient):
+    """Test the thread of a post that doesn't exist"""
+    response = api_client.get("/post/99999/thread/")
+    assert response.status_code == 404
+
+
+def test_reply_count(api_client_user1: TestClient):
+    """Test replies are counted on the parent post"""
+    post = api_client_user1.post("/post/", json={"text": "Parent"}).json()
+    for i in range(2):
+        api_client_user1.post(
+            "/post/", json={"text": f"Reply {i+1}", "parent_id": post["id"]}
+        )
+
+    response = api_client_user1.get("/post/")
+    parent = next(p for p in response.json()["items"] if p["id"] == post["id"])
+    assert parent["reply_count"] == 2
+
+
+def test_fast_json_matches_default(monkeypatch, api_client_user1: TestClient):
+    """Test the fast JSON path returns the same body as the default one"""
+    post = api_client_user1.post("/post/", json={"text": "Root"}).json()
+    api_client_user1.post(
+        "/post/", json={"text": "Reply", "parent_id": post["id"]}
+    )
+    urls = ["/post/?limit=1", "/post/user/user1/?include_replies=true"]
+
+    fast = [api_client_user1.get(url) for url in urls]
+    monkeypatch.setattr("microblog.responses.FAST_JSON", False)
+    # otherwise the default path replays the fast responses
+    asyncio.run(response_cache.clear())
+    default = [api_client_user1.get(url) for url in urls]
+
+    for fast_response, default_response in zip(fast, default):
+        assert fast_response.status_code == 200
+        assert default_response.headers["x-cache"] == "MISS"
+        assert fast_response.json() == default_response.json()
+        assert fast_response.headers["content-type"] == "application/json"
+
+
+def test_list_posts_sparse_fields(api_client_user1: TestClient):
+    """Test the fields parameter returns only the requested fields"""
+    for i in range(3):
+        api_client_user1.post("/post/", json={"text": f"Post {i+1}"})
+
+    response = api_client_user1.get(
+        "/post/", params={"fields": "text,like_count", "limit": 2}
+    )
+    assert response.status_code == 200
+    page = response.json()
+    assert page["items"] == [
+        {"text": "Post 3", "like_count": 0},
+        {"text": "Post 2", "like_count": 0},
+    ]
+
+    # the cursor is built from columns that were not requested
+    response = api_client_user1.get(
+        "/post/",
+        params={"fields": "text", "before": page["next_cursor"]},
+    )
+    assert response.json()["items"] == [{"text": "Post 1"}]
+
+
+def test_list_posts_unknown_field(api_client: TestClient):
+    """Test fields outside the response model are rejected"""
+    response = api_client.get("/post/", params={"fields": "text,password"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown fields: password"
+
+
+def test_list_posts_empty_fields(api_client: TestClient):
+    """Test a fields list made only of commas is rejected"""
+    response = api_client.get("/post/", params={"fields": " , "})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "fields must not be empty"
@@ -0,0 +1,55 @@
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+
+from microblog.instrumentation import (
+    QueryBudgetExceeded,
+    RequestStats,
+    statement_shape,
+)
+
+
+def test_server_timing_header(api_client_user1: TestClient):
+    """Test responses report their queries in Server-Timing"""
+    api_client_user1.post("/post/", json={"text": "hello"})
+    response = api_client_user1.get("/post/")
+    assert response.status_code == 200
+    timing = response.headers["server-timing"]
+    assert timing.startswith("db;dur=")
+    assert 'desc="1 queries"' in timing
+    assert "app;dur=" in timing
+
+
+def test_strict_budget_raises(monkeypatch, api_client: TestClient):
+    """Test a request over the query budget raises in strict mode"""
+    monkeypatch.setattr("microblog.instrumentation.STRICT", True)
+    monkeypatch.setattr("microblog.instrumentation.STRICT_ACTION", "raise")
+    monkeypatch.setattr("microblog.instrumentation.BUDGET", 0)
+    with pytest.raises(QueryBudgetExceeded):
+        api_client.get("/post/")
+
+
+def test_strict_budget_logs(monkeypatch, caplog, api_client: TestClient):
+    """Test a request over the query budget is logged"""
+    monkeypatch.setattr("microblog.instrumentation.STRICT", True)
+    monkeypatch.setattr("microblog.instrumentation.BUDGET", 0)
+    with caplog.at_level(logging.WARNING, "microblog.instrumentation"):
+        response = api_client.get("/post/")
+    assert response.status_code == 200
+    assert "GET /post/: more than 0 queries" in caplog.text
+
+
+def test_repeated_statement_shape(monkeypatch):
+    """Test repeated statements are detected whatever their values"""
+    monkeypatch.setattr("microblog.instrumentation.STRICT_ACTION", "raise")
+    monkeypatch.setattr("microblog.instrumentation.REPEAT_LIMIT", 3)
+    stats = RequestStats()
+    shape = statement_shape("SELECT * FROM post\n WHERE id IN (1, 2, 3)")
+    assert shape == statement_shape("SELECT * FROM post WHERE id IN (4)")
+    for _ in range(2):
+        stats.shapes[shape] += 1
+        stats.check(shape)
+    stats.shapes[shape] += 1
+    with pytest.raises(QueryBudgetExceeded, match="repeated 3 times"):
+        stats.check(shape)
@@ -0,0 +1,64 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from microblog import ratelimit
+from microblog.cli import create_user
+from microblog.security import hashing_pool
+
+
+def test_take_token():
+    """Test the token bucket refills up to its burst"""
+    limit = ratelimit.Limit(rate=1, per=2, burst=2)
+    assert ratelimit.take_token(2, 0, limit) == (1, 0)
+    assert ratelimit.take_token(0, 0, limit) == (0, 2)
+    # half a token refilled, a second more to wait
+    assert ratelimit.take_token(0, 1, limit) == (0.5, 1)
+    # never above the burst
+    assert ratelimit.take_token(1, 60, limit) == (1, 0)
+
+
+def test_memory_backend():
+    """Test the memory backend keeps a bucket per client"""
+    async def run():
+        backend = ratelimit.MemoryBackend(maxsize=10, redis_url="")
+        limit = ratelimit.Limit(rate=1, per=60, burst=2)
+        assert await backend.take("a", limit) == 0
+        assert await backend.take("a", limit) == 0
+        assert 59 < await backend.take("a", limit) <= 60
+        assert await backend.take("b", limit) == 0
+        assert len(backend.buckets) == 2
+
+    asyncio.run(run())
+
+
+def test_login_throttled_before_hashing(api_client: TestClient, monkeypatch):
+    """Test a throttled login is refused before bcrypt runs"""
+    monkeypatch.setitem(
+        ratelimit.LIMITS, "token", ratelimit.Limit(rate=1, per=60, burst=2)
+    )
+    create_user("login@microblog.com", "login", "login")
+    form = {"username": "login", "password": "wrong"}
+    assert api_client.post("/token", data=form).status_code == 401
+    assert api_client.post("/token", data=form).status_code == 401
+
+    completed = hashing_pool.completed
+    response = api_client.post("/token", data=form)
+    assert response.status_code == 429
+    assert 0 < int(response.headers["Retry-After"]) <= 60
+    assert hashing_pool.completed == completed
+
+
+def test_create_post_limited_per_user(
+    api_client_user1: TestClient, api_client_user2: TestClient, monkeypatch
+):
+    """Test posting is limited per user"""
+    monkeypatch.setitem(
+        ratelimit.LIMITS,
+        "create_post",
+        ratelimit.Limit(rate=1, per=60, burst=1, by="user"),
+    )
+    post = {"text": "hello"}
+    assert api_client_user1.post("/post/", json=post).status_code == 201
+    assert api_client_user1.post("/post/", json=post).status_code == 429
+    assert api_client_user2.post("/post/", json=post).status_code == 201
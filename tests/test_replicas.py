@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from microblog import db
+from microblog.config import config
+
+
+def request(method="GET", authorization=None):
+    headers = {}
+    if authorization:
+        headers["authorization"] = authorization
+    return SimpleNamespace(method=method, headers=headers)
+
+
+def test_round_robin():
+    """Test reads alternate between replicas and writes use the primary"""
+    router = db.ReplicaRouter("primary", ["r1", "r2"])
+    assert [router.engine_for(request()) for _ in range(3)] == [
+        "r1", "r2", "r1"
+    ]
+    assert router.engine_for(request("HEAD")) == "r2"
+    assert router.engine_for(request("POST")) == "primary"
+    assert db.ReplicaRouter("primary", []).engine_for(request()) == "primary"
+
+
+def test_least_loaded():
+    """Test reads go to the replica with the fewest sessions"""
+    router = db.ReplicaRouter("primary", ["r1", "r2"], "least_loaded")
+    router.open_sessions["r1"] = 3
+    router.open_sessions["r2"] = 1
+    assert router.engine_for(request()) == "r2"
+    with pytest.raises(RuntimeError):
+        db.ReplicaRouter("primary", ["r1"], "random")
+
+
+def test_read_your_writes():
+    """Test a writer keeps reading from the primary"""
+    router = db.ReplicaRouter("primary", ["r1"], sticky_seconds=60)
+    router.wrote(request("POST", "Bearer a"))
+    assert router.engine_for(request("GET", "Bearer a")) == "primary"
+    assert router.engine_for(request("GET", "Bearer b")) == "r1"
+    assert router.engine_for(request()) == "r1"
+
+
+def test_routes_reads_to_replica(
+    api_client: TestClient, api_client_user1: TestClient, monkeypatch
+):
+    """Test GET requests read from the replica"""
+    replica = db.make_async_engine(db.get_async_uri(config.db.uri))
+    router = db.ReplicaRouter(db.async_engine, [replica], sticky_seconds=60)
+    monkeypatch.setattr(db, "replica_router", router)
+    replica_queries = []
+    event.listen(
+        replica.sync_engine,
+        "before_cursor_execute",
+        lambda *args: replica_queries.append(args[2]),
+    )
+
+    assert api_client.get("/post/").status_code == 200
+    assert len(replica_queries) == 1
+
+    # the author reads the primary right after writing
+    api_client_user1.post("/post/", json={"text": "fresh"})
+    response = api_client_user1.get("/post/user/user1/")
+    assert [post["text"] for post in response.json()["items"]] == ["fresh"]
+    assert len(replica_queries) == 1
+
+    # not the url cached above
+    api_client.get("/post/user/user1/?limit=5")
+    assert len(replica_queries) == 2
+    assert router.open_sessions == {db.async_engine: 0, replica: 0}
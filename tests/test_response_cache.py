@@ -0,0 +1,85 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from microblog.response_cache import MemoryBackend
+
+
+def test_post_listing_cached_until_new_post(api_client_user1: TestClient):
+    """Test post listings are cached until a new post"""
+    api_client_user1.post("/post/", json={"text": "First"})
+    response = api_client_user1.get("/post/")
+    assert response.headers["x-cache"] == "MISS"
+    response = api_client_user1.get("/post/")
+    assert response.headers["x-cache"] == "HIT"
+    assert [p["text"] for p in response.json()["items"]] == ["First"]
+
+    api_client_user1.post("/post/", json={"text": "Second"})
+    response = api_client_user1.get("/post/")
+    assert response.headers["x-cache"] == "MISS"
+    assert [p["text"] for p in response.json()["items"]] == [
+        "Second", "First"
+    ]
+
+
+def test_like_invalidates_post_listings(
+    api_client_user1: TestClient, api_client_user2: TestClient
+):
+    """Test a like invalidates the cached post listings"""
+    post = api_client_user1.post("/post/", json={"text": "Like me"}).json()
+    url = "/post/user/user1/"
+    api_client_user1.get(url)
+    assert api_client_user1.get(url).headers["x-cache"] == "HIT"
+
+    api_client_user2.post(f"/post/{post['id']}/like/")
+    response = api_client_user1.get(url)
+    assert response.headers["x-cache"] == "MISS"
+    assert response.json()["items"][0]["like_count"] == 1
+
+
+def test_user_cache_invalidation(
+    api_client_user1: TestClient, api_client_user2: TestClient
+):
+    """Test a follow invalidates the cached user profile"""
+    response = api_client_user1.get("/user/user2/")
+    etag = response.headers["etag"]
+    response = api_client_user1.get("/user/user2/")
+    assert response.headers["x-cache"] == "HIT"
+    assert response.headers["etag"] == etag
+
+    # a cached response still answers conditional requests
+    response = api_client_user1.get(
+        "/user/user2/", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    user2 = api_client_user1.get("/user/user2/").json()
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+    response = api_client_user1.get("/user/user2/")
+    assert response.headers["x-cache"] == "MISS"
+    assert response.json()["follower_count"] == 1
+
+
+def test_cache_disabled(monkeypatch, api_client: TestClient):
+    """Test nothing is cached when the cache is disabled"""
+    monkeypatch.setattr("microblog.response_cache.ENABLED", False)
+    api_client.get("/user/")
+    assert "x-cache" not in api_client.get("/user/").headers
+
+
+def test_memory_backend_tags():
+    """Test the memory backend invalidates by tag"""
+    backend = MemoryBackend(maxsize=2, ttl=60)
+
+    async def scenario():
+        await backend.set("/a", b"a", ["posts"])
+        await backend.set("/b", b"b", ["posts", "users"])
+        await backend.set("/c", b"c", ["users"])
+        # /a was pushed out by the size bound
+        assert await backend.get("/a") is None
+        await backend.invalidate("users")
+        assert await backend.get("/b") is None
+        assert await backend.get("/c") is None
+        assert backend.tags == {"posts": {"/a", "/b"}}
+
+    asyncio.run(scenario())
@@ -0,0 +1,67 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from microblog import search
+from microblog.db import engine
+from tests.conftest import texts
+
+
+def test_search_posts(api_client_user1: TestClient):
+    """Test searching posts, most relevant first"""
+    api_client_user1.post("/post/", json={"text": "fastapi is fast"})
+    api_client_user1.post("/post/", json={"text": "postgres fastapi fastapi"})
+    api_client_user1.post("/post/", json={"text": "nothing to see"})
+
+    response = api_client_user1.get("/post/search", params={"q": "fastapi"})
+    assert response.status_code == 200
+    # more occurrences rank first
+    assert texts(response) == ["postgres fastapi fastapi", "fastapi is fast"]
+
+    response = api_client_user1.get(
+        "/post/search", params={"q": "fastapi postgres"}
+    )
+    assert texts(response) == ["postgres fastapi fastapi"]
+
+    response = api_client_user1.get("/post/search", params={"q": "missing"})
+    assert texts(response) == []
+
+
+def test_search_pagination(api_client_user1: TestClient):
+    """Test paginating search results"""
+    for i in range(3):
+        api_client_user1.post("/post/", json={"text": f"python {i}"})
+
+    seen = []
+    params = {"q": "python", "limit": 1}
+    while True:
+        page = api_client_user1.get("/post/search", params=params).json()
+        seen.extend(post["text"] for post in page["items"])
+        if not page["next_cursor"]:
+            break
+        params["before"] = page["next_cursor"]
+    assert sorted(seen) == ["python 0", "python 1", "python 2"]
+
+
+def test_search_query_is_not_syntax(api_client_user1: TestClient):
+    """Test search input is never parsed as query syntax"""
+    api_client_user1.post("/post/", json={"text": "quotes and or not"})
+    for q in ['"quotes', "quotes OR", "NOT quotes", "quotes*"]:
+        response = api_client_user1.get("/post/search", params={"q": q})
+        assert response.status_code == 200
+
+
+def test_search_requires_query(api_client: TestClient):
+    """Test searching without a query"""
+    assert api_client.get("/post/search").status_code == 422
+    assert api_client.get("/post/search?q=").status_code == 422
+
+
+def test_search_reindex(api_client_user1: TestClient):
+    """Test rebuilding the search index"""
+    api_client_user1.post("/post/", json={"text": "indexed twice"})
+    with Session(engine) as session:
+        assert search.rebuild(session) == 1
+        session.commit()
+
+    response = api_client_user1.get("/post/search", params={"q": "twice"})
+    assert texts(response) == ["indexed twice"]
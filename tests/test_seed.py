@@ -0,0 +1,46 @@
+from sqlmodel import Session, func, select
+
+from microblog.db import engine
+from microblog.models import Like, Post, Social, User
+from microblog.seed import seed_database
+
+
+def dataset():
+    with Session(engine) as session:
+        return {
+            model.__name__: session.exec(select(func.count(model.id))).one()
+            for model in (User, Social, Post, Like)
+        }
+
+
+def test_seed_is_repeatable(api_client):
+    """Test the same seed generates the same dataset"""
+    options = dict(users=20, posts=100, likes=200, follows=5, echo=str)
+    stats = seed_database(engine, **options)
+    assert set(stats) == {"user", "social", "post", "like"}
+    first = dataset()
+    assert first["User"] == 20 and first["Post"] == 100
+
+    seed_database(engine, prefix="again", **options)
+    second = dataset()
+    assert {k: second[k] - first[k] for k in first} == first
+
+
+def test_seeded_user_can_login(api_client):
+    """Test seeded users log in with the shared password"""
+    seed_database(
+        engine, users=3, posts=10, likes=10, follows=2, echo=str
+    )
+    response = api_client.post(
+        "/token", data={"username": "seed0", "password": "microblog"}
+    )
+    assert response.status_code == 200
+
+    # counters are reconciled after the bulk load
+    response = api_client.get("/user/seed0/")
+    followers = response.json()["follower_count"]
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.username == "seed0")).one()
+        assert followers == session.exec(
+            select(func.count(Social.id)).where(Social.to_user_id == user.id)
+        ).one()
@@ -1,5 +1,10 @@
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import Session
+
+from microblog.cli import reconcile_counters, timeline_rebuild
+from microblog.db import engine
 
 def test_follow_user(api_client_user1: TestClient, api_client_user2: TestClient):
     """Test following a user"""
@@ -46,7 +51,8 @@ def test_timeline_empty(api_client_user1: TestClient):
     """Test timeline when not following anyone"""
     response = api_client_user1.get("/user/timeline")
     assert response.status_code == 200
-    assert response.json() == []
+    assert response.json()["items"] == []
+    assert response.json()["next_cursor"] is None
 
 def test_timeline_with_posts(api_client_user1: TestClient, api_client_user2: TestClient):
     """Test timeline with posts from followed users"""
@@ -69,7 +75,7 @@ def test_timeline_with_posts(api_client_user1: TestClient, api_client_user2: Tes
     # Check User1's timeline
     response = api_client_user1.get("/user/timeline")
     assert response.status_code == 200
-    results = response.json()
+    results = response.json()["items"]
     assert len(results) == 3
     for result in results:
         assert result["user_id"] == user2["id"]
@@ -108,7 +114,7 @@ def test_timeline_with_replies(api_client_user1: TestClient, api_client_user2: T
     # Check User1's timeline
     response = api_client_user1.get("/user/timeline")
     assert response.status_code == 200
-    results = response.json()
+    results = response.json()["items"]
     assert len(results) == 3  # Original post + 2 replies
     
     # Verify the original post
@@ -122,4 +128,114 @@ def test_timeline_with_replies(api_client_user1: TestClient, api_client_user2: T
     for reply in replies:
         assert reply["parent_id"] == post["id"]
         assert reply["user_id"] == user2["id"]
-        assert "Reply" in reply["text"] 
\ No newline at end of file
+        assert "Reply" in reply["text"] 
+
+@pytest.mark.parametrize("mode", ["write", "hybrid"])
+def test_timeline_fan_out_on_write(
+    mode, monkeypatch, api_client_user1: TestClient, api_client_user2: TestClient
+):
+    """Test materialized timelines are backfilled and fed by new posts"""
+    monkeypatch.setattr("microblog.timeline.MODE", mode)
+    user2 = api_client_user2.get("/user/user2/").json()
+
+    api_client_user2.post("/post/", json={"text": "Before follow"})
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+    api_client_user2.post("/post/", json={"text": "After follow"})
+
+    response = api_client_user1.get("/user/timeline")
+    assert response.status_code == 200
+    results = response.json()["items"]
+    assert [post["text"] for post in results] == ["After follow", "Before follow"]
+
+
+def test_timeline_hybrid_heavy_author(
+    monkeypatch, api_client_user1: TestClient, api_client_user2: TestClient
+):
+    """Test authors above the fan-out limit are merged in at read time"""
+    monkeypatch.setattr("microblog.timeline.MODE", "hybrid")
+    monkeypatch.setattr("microblog.timeline.FANOUT_MAX_FOLLOWERS", 0)
+    user2 = api_client_user2.get("/user/user2/").json()
+
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+    for i in range(3):
+        api_client_user2.post("/post/", json={"text": f"Heavy post {i+1}"})
+
+    response = api_client_user1.get("/user/timeline", params={"limit": 2})
+    page = response.json()
+    assert [post["text"] for post in page["items"]] == [
+        "Heavy post 3", "Heavy post 2"
+    ]
+    response = api_client_user1.get(
+        "/user/timeline", params={"limit": 2, "before": page["next_cursor"]}
+    )
+    assert [post["text"] for post in response.json()["items"]] == [
+        "Heavy post 1"
+    ]
+
+
+def test_timeline_hybrid_demoted_author(
+    monkeypatch, api_client_user1: TestClient, api_client_user2: TestClient
+):
+    """Test posts of an author no longer heavy stay in the timeline"""
+    monkeypatch.setattr("microblog.timeline.MODE", "hybrid")
+    monkeypatch.setattr("microblog.timeline.FANOUT_MAX_FOLLOWERS", 1)
+    user2 = api_client_user2.get("/user/user2/").json()
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+    with Session(engine) as session:
+        session.execute(text('UPDATE "user" SET follower_count = 42'))
+        session.commit()
+    api_client_user2.post("/post/", json={"text": "Heavy post"})
+
+    texts = ["Heavy post"]
+    response = api_client_user1.get("/user/timeline")
+    assert [post["text"] for post in response.json()["items"]] == texts
+
+    # back to its single follower, the post is fanned out
+    reconcile_counters()
+    response = api_client_user1.get("/user/timeline")
+    assert [post["text"] for post in response.json()["items"]] == texts
+    with Session(engine) as session:
+        entries = session.execute(text("SELECT post_id FROM timeline_entry"))
+        assert len(entries.all()) == 1
+
+
+def test_timeline_rebuild_backfill_limit(
+    monkeypatch, api_client_user1: TestClient, api_client_user2: TestClient
+):
+    """Test a rebuild copies at most BACKFILL_LIMIT posts per author"""
+    monkeypatch.setattr("microblog.timeline.MODE", "write")
+    monkeypatch.setattr("microblog.timeline.BACKFILL_LIMIT", 2)
+    user2 = api_client_user2.get("/user/user2/").json()
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+    for i in range(3):
+        api_client_user2.post("/post/", json={"text": f"Post {i+1}"})
+
+    timeline_rebuild()
+    response = api_client_user1.get("/user/timeline")
+    assert [post["text"] for post in response.json()["items"]] == [
+        "Post 3", "Post 2"
+    ]
+
+
+def test_follower_counts(api_client_user1: TestClient, api_client_user2: TestClient):
+    """Test follows are counted on both users"""
+    user2 = api_client_user2.get("/user/user2/").json()
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+
+    assert api_client_user1.get("/user/user2/").json()["follower_count"] == 1
+    assert api_client_user1.get("/user/user1/").json()["following_count"] == 1
+
+
+def test_reconcile_counters(api_client_user1: TestClient, api_client_user2: TestClient):
+    """Test the counters are recomputed from the source tables"""
+    user2 = api_client_user2.get("/user/user2/").json()
+    api_client_user1.post(f"/user/follow/{user2['id']}")
+    with Session(engine) as session:
+        session.execute(text('UPDATE "user" SET follower_count = 42'))
+        session.commit()
+
+    reconcile_counters()
+
+    assert api_client_user1.get("/user/user2/").json()["follower_count"] == 1
+    assert api_client_user1.get("/user/user1/").json()["follower_count"] == 0
@@ -0,0 +1,75 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from microblog import tags
+from microblog.db import engine
+from tests.conftest import texts
+
+
+def test_extract():
+    """Test extracting hashtags and mentions from a text"""
+    text = "#Python and #python, #fastapi! mail@example.com page#anchor @user2"
+    assert tags.extract_tags(text) == ["python", "fastapi"]
+    assert tags.extract_mentions(text) == ["user2"]
+    assert tags.extract_tags("#" + "x" * 65) == []
+
+
+def test_posts_by_tag(api_client_user1: TestClient):
+    """Test listing the posts with a hashtag"""
+    api_client_user1.post("/post/", json={"text": "first #Python"})
+    api_client_user1.post("/post/", json={"text": "no tag python"})
+    api_client_user1.post("/post/", json={"text": "second #python #async"})
+
+    response = api_client_user1.get("/post/tag/python/")
+    assert response.status_code == 200
+    assert texts(response) == ["second #python #async", "first #Python"]
+    assert texts(api_client_user1.get("/post/tag/ASYNC/")) == [
+        "second #python #async"
+    ]
+    assert texts(api_client_user1.get("/post/tag/missing/")) == []
+
+
+def test_posts_by_tag_pagination(api_client_user1: TestClient):
+    """Test paginating the posts with a hashtag"""
+    for i in range(3):
+        api_client_user1.post("/post/", json={"text": f"#paged {i}"})
+
+    seen = []
+    params = {"limit": 2}
+    while True:
+        page = api_client_user1.get("/post/tag/paged/", params=params).json()
+        seen.extend(post["text"] for post in page["items"])
+        if not page["next_cursor"]:
+            break
+        params["before"] = page["next_cursor"]
+    assert seen == ["#paged 2", "#paged 1", "#paged 0"]
+
+
+def test_user_mentions(
+    api_client_user1: TestClient, api_client_user2: TestClient
+):
+    """Test listing the posts mentioning a user"""
+    api_client_user1.post("/post/", json={"text": "hello @user2"})
+    api_client_user1.post("/post/", json={"text": "hello @nobody"})
+    api_client_user1.post("/post/", json={"text": "@user2 @user2 again"})
+
+    response = api_client_user1.get("/user/user2/mentions/")
+    assert response.status_code == 200
+    assert texts(response) == ["@user2 @user2 again", "hello @user2"]
+    assert texts(api_client_user1.get("/user/user1/mentions/")) == []
+    assert api_client_user1.get("/user/nobody/mentions/").status_code == 404
+
+
+def test_tags_reindex(
+    api_client_user1: TestClient, api_client_user2: TestClient
+):
+    """Test rebuilding the hashtags and mentions"""
+    api_client_user1.post("/post/", json={"text": "#again @user2"})
+    with Session(engine) as session:
+        rows = tags.rebuild(session)
+        session.commit()
+    assert rows == {"post_tag": 1, "post_mention": 1}
+    assert texts(api_client_user1.get("/post/tag/again/")) == ["#again @user2"]
+    assert texts(api_client_user1.get("/user/user2/mentions/")) == [
+        "#again @user2"
+    ]
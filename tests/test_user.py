@@ -102,4 +102,13 @@ def test_list_users(api_client: TestClient):
     for result in results:
         assert "username" in result
         assert "email" in result
-        assert "password" not in result 
\ No newline at end of file
+        assert "password" not in result 
+
+
+def test_list_users_sparse_fields(api_client_user1: TestClient):
+    """Test listing only some user fields"""
+    response = api_client_user1.get("/user/", params={"fields": "username"})
+    assert response.status_code == 200
+    users = response.json()
+    assert {"username": "user1"} in users
+    assert all(list(user) == ["username"] for user in users)